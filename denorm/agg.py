@@ -1,11 +1,30 @@
 import dataclasses
 import typing
 
+from .agg_bypass import create_catchup_function, create_staging_table
 from .agg_change import create_change
-from .agg_clean import create_cleanup, create_compress
+from .agg_clean import (
+    create_compact,
+    create_compress,
+    create_shard_stats,
+)
 from .agg_common import AggStructure
-from .agg_defer import create_refresh_function, create_setup_function
-from .formats.agg import AGG_DATA_JSON_FORMAT, AggAggregate, AggConfig, AggConsistency
+from .agg_defer import (
+    create_flush_function,
+    create_refresh_function,
+    create_setup_function,
+    create_unlogged_tables,
+)
+from .agg_distinct import create_distinct_tables
+from .agg_index import create_indexes
+from .formats.agg import (
+    AGG_DATA_JSON_FORMAT,
+    AggAggregate,
+    AggAggregateKind,
+    AggConfig,
+    AggConsistency,
+    AggDeferredStorage,
+)
 from .resource import ResourceFactory
 
 
@@ -15,17 +34,42 @@ class AggIo:
     output: ResourceFactory[typing.TextIO]
 
 
-def create_agg(io: AggIo):
+def create_agg(io: AggIo, indexes: bool = False):
     schema = AGG_DATA_JSON_FORMAT.load(io.config)
 
+    statements = create_indexes(schema) if indexes else _statements(schema)
+
     with io.output() as f:
-        for statement in _statements(schema):
+        for statement in statements:
             print(f"{statement};\n", file=f)
 
 
 def _statements(config: AggConfig):
-    if config.shard and config.consistency == AggConsistency.DEFERRED:
-        raise RuntimeError("Deferred consistency cannot be used with sharding.")
+    if config.rollups and (
+        config.shard or config.consistency != AggConsistency.IMMEDIATE
+    ):
+        raise RuntimeError(
+            "Rollups can only be used with immediate consistency and without sharding."
+        )
+
+    if any(
+        agg.kind == AggAggregateKind.DISTINCT for agg in config.aggregates.values()
+    ) and (
+        config.bypass
+        or config.rollups
+        or config.shard
+        or config.consistency != AggConsistency.IMMEDIATE
+    ):
+        raise RuntimeError(
+            "Distinct aggregates can only be used with immediate consistency, without bypass, sharding, or rollups."
+        )
+
+    if any(agg.extreme for agg in config.aggregates.values()) and (
+        config.rollups or config.shard or config.consistency != AggConsistency.IMMEDIATE
+    ):
+        raise RuntimeError(
+            "Min and max aggregates can only be used with immediate consistency, without sharding or rollups."
+        )
 
     structure = AggStructure(config.schema, config.id)
 
@@ -36,32 +80,82 @@ def _statements(config: AggConfig):
     if config.consistency == AggConsistency.DEFERRED:
         yield from create_refresh_function(
             aggregates=config.aggregates,
+            deferred_storage=config.deferred_storage,
             groups=config.groups,
             id=config.id,
+            shard=bool(config.shard),
             structure=structure,
             target=config.target,
         )
 
-        yield from create_setup_function(
-            aggregates=config.aggregates,
-            groups=config.groups,
+        yield from create_flush_function(
             id=config.id,
+            storage=config.deferred_storage,
             structure=structure,
-            target=config.target,
         )
 
+        if config.deferred_storage == AggDeferredStorage.TEMP:
+            yield from create_setup_function(
+                aggregates=config.aggregates,
+                groups=config.groups,
+                id=config.id,
+                structure=structure,
+                target=config.target,
+            )
+        elif config.deferred_storage == AggDeferredStorage.UNLOGGED:
+            yield from create_unlogged_tables(
+                aggregates=config.aggregates,
+                groups=config.groups,
+                id=config.id,
+                structure=structure,
+                target=config.target,
+            )
+
+    if config.bypass:
+        yield from create_staging_table(
+            id=config.id, source=config.source, structure=structure
+        )
+
+    yield from create_distinct_tables(
+        aggregates=config.aggregates,
+        filter=config.filter,
+        groups=config.groups,
+        id=config.id,
+        source=config.source,
+        structure=structure,
+    )
+
     yield from create_change(
         aggregates=config.aggregates,
+        bypass=config.bypass,
         consistency=config.consistency,
+        deferred_storage=config.deferred_storage,
         filter=config.filter,
         groups=config.groups,
         id=config.id,
+        rollups=config.rollups,
         shard=config.shard,
         source=config.source,
         structure=structure,
         target=config.target,
+        update_columns=config.update_columns,
     )
 
+    if config.bypass:
+        yield from create_catchup_function(
+            aggregates=config.aggregates,
+            consistency=config.consistency,
+            deferred_storage=config.deferred_storage,
+            filter=config.filter,
+            groups=config.groups,
+            id=config.id,
+            rollups=config.rollups,
+            shard=config.shard,
+            source=config.source,
+            structure=structure,
+            target=config.target,
+        )
+
     if type(config.shard) == dict:
         yield from create_compress(
             aggregates=config.aggregates,
@@ -71,11 +165,19 @@ def _statements(config: AggConfig):
             structure=structure,
             target=config.target,
         )
-    elif not config.shard:
-        yield from create_cleanup(
-            id=config.id,
+
+        yield from create_compact(
+            aggregates=config.aggregates,
             groups=config.groups,
+            id=config.id,
             shard=config.shard,
             structure=structure,
             target=config.target,
         )
+
+        yield from create_shard_stats(
+            groups=config.groups,
+            id=config.id,
+            structure=structure,
+            target=config.target,
+        )
@@ -0,0 +1,128 @@
+import typing
+
+from pg_sql import SqlId, SqlString
+
+from .agg_change import (
+    change_finalize,
+    change_query,
+    delete_empty,
+    delete_empty_vars,
+    rollup_change,
+)
+from .agg_common import AggStructure
+from .formats.agg import (
+    AggAggregate,
+    AggConsistency,
+    AggDeferredStorage,
+    AggRollup,
+    AggTable,
+)
+from .sql import SqlTableExpr
+from .string import indent
+
+
+def create_staging_table(id: str, source: AggTable, structure: AggStructure):
+    staging_table = structure.staging_table()
+
+    yield f"""
+CREATE TABLE {staging_table}
+AS SELECT NULL::smallint AS sign, *
+FROM {source.sql}
+WITH NO DATA
+    """.strip()
+
+    yield f"""
+COMMENT ON TABLE {staging_table} IS {SqlString(f"Changes to {source.sql} made in bypass mode")}
+    """.strip()
+
+
+def create_catchup_function(
+    aggregates: typing.Dict[str, AggAggregate],
+    consistency: AggConsistency,
+    filter: typing.Optional[str],
+    groups: typing.Dict[str, str],
+    id: str,
+    shard: typing.Union[bool, typing.Dict[str, str]],
+    source: AggTable,
+    structure: AggStructure,
+    target: AggTable,
+    deferred_storage: AggDeferredStorage = AggDeferredStorage.TEMP,
+    rollups: typing.List[AggRollup] = [],
+):
+    """
+    Process the changes staged in bypass mode
+    """
+    staged = SqlId("_staged")
+
+    query = change_query(
+        aggregates=aggregates,
+        consistency=consistency,
+        data=str(staged),
+        deferred_storage=deferred_storage,
+        filter=filter,
+        groups=groups,
+        id=id,
+        shard=shard,
+        structure=structure,
+        target=target,
+    )
+    stage = SqlTableExpr(staged, f"DELETE FROM {structure.staging_table()} RETURNING *")
+    query.prepend(stage)
+
+    if (
+        consistency == AggConsistency.DEFERRED
+        and deferred_storage == AggDeferredStorage.TEMP
+    ):
+        setup = f"PERFORM {structure.setup_function()}();"
+    else:
+        setup = ""
+
+    if rollups:
+        vars, apply = rollup_change(
+            aggregates=aggregates,
+            data=str(staged),
+            exprs=[stage],
+            filter=filter,
+            groups=groups,
+            id=id,
+            rollups=rollups,
+            target=target,
+        )
+    elif consistency == AggConsistency.IMMEDIATE and not shard:
+        apply = delete_empty(
+            query,
+            aggregates=aggregates,
+            filter=filter,
+            groups=groups,
+            id=id,
+            source=source,
+            target_table=target.sql,
+        )
+        vars = delete_empty_vars(aggregates)
+    else:
+        apply = f"{str(query).strip()};"
+        vars = ""
+
+    body = f"""
+{setup}
+
+{apply}
+
+{change_finalize(consistency=consistency, deferred_storage=deferred_storage, structure=structure)}
+    """.strip()
+
+    function = structure.catchup_function()
+    yield f"""
+CREATE FUNCTION {function} () RETURNS void
+LANGUAGE plpgsql AS $$
+  DECLARE
+    {vars}
+  BEGIN
+{indent(body, 2)}
+  END;
+$$
+    """.strip()
+
+    yield f"""
+COMMENT ON FUNCTION {function} IS {SqlString(f"Process changes staged in bypass mode for {id}")}
+    """.strip()
@@ -1,13 +1,386 @@
 import typing
 
-from pg_sql import SqlId, SqlNumber, SqlString, sql_list
+from pg_sql import SqlId, SqlNumber, SqlObject, SqlString, sql_list
 
 from .agg_common import AggStructure
-from .formats.agg import AggAggregate, AggConsistency, AggTable
-from .sql import table_fields
+from .agg_distinct import distinct_aggregates, distinct_change
+from .formats.agg import (
+    AggAggregate,
+    AggAggregateKind,
+    AggConsistency,
+    AggDeferredStorage,
+    AggRollup,
+    AggTable,
+)
+from .sql import SqlQuery, SqlTableExpr, table_fields
+from .sql_expr import expression_columns
 from .string import indent
 
 
+def _update_columns(
+    aggregates: typing.Dict[str, AggAggregate],
+    filter: typing.Optional[str],
+    groups: typing.Dict[str, str],
+    id: str,
+    rollups: typing.List[AggRollup] = [],
+) -> typing.Optional[typing.List[str]]:
+    """
+    Source columns whose updates can affect the target, or None if any can
+    """
+    expressions = list(groups.values()) + [agg.value for agg in aggregates.values()]
+    for rollup in rollups:
+        expressions.extend(rollup.groups.values())
+    if filter is not None:
+        expressions.append(filter)
+
+    columns = set()
+    for expression in expressions:
+        names = expression_columns(expression, alias=id, variables=["sign"])
+        if names is None:
+            return None
+        columns.update(names)
+
+    return sorted(columns) or None
+
+
+def change_query(
+    aggregates: typing.Dict[str, AggAggregate],
+    consistency: AggConsistency,
+    data: str,
+    filter: typing.Optional[str],
+    groups: typing.Dict[str, str],
+    id: str,
+    shard: typing.Union[bool, typing.Dict[str, str]],
+    structure: AggStructure,
+    target: AggTable,
+    deferred_storage: AggDeferredStorage = AggDeferredStorage.TEMP,
+) -> SqlQuery:
+    """
+    Apply changed source records to the target
+    """
+    group_columns = [SqlId(col) for col in groups]
+    aggregate_columns = [SqlId(col) for col in aggregates]
+
+    where = f"WHERE {filter}" if filter is not None else ""
+    conflict_columns = group_columns
+    if consistency == AggConsistency.DEFERRED:
+        order = ""
+        if deferred_storage == AggDeferredStorage.TEMP:
+            target_table = structure.tmp_table()
+        elif deferred_storage == AggDeferredStorage.UNLOGGED:
+            # txid defaults to the current transaction
+            target_table = structure.unlogged_tmp_table()
+            conflict_columns = [SqlId("txid")] + group_columns
+    elif consistency == AggConsistency.IMMEDIATE:
+        target_table = target.sql
+        order = f"ORDER BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(groups))}"
+
+    query = f"""
+SELECT
+    {sql_list(value for value in groups.values())},
+    {sql_list(agg.change_expression() for agg in aggregates.values())}
+FROM {data} AS {SqlId(id)}
+{where}
+GROUP BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(groups))}
+HAVING ({sql_list(agg.change_expression() for agg in aggregates.values())}) IS DISTINCT FROM ({sql_list(agg.identity_expression() for agg in aggregates.values())})
+    """.strip()
+
+    # deferred changes are applied to shards by the refresh
+    if shard and consistency == AggConsistency.IMMEDIATE:
+        return shard_query(
+            aggregates=aggregates,
+            groups=groups,
+            query=query,
+            target_table=target_table,
+        )
+
+    extremes = {col: agg for col, agg in aggregates.items() if agg.extreme}
+    if extremes:
+        # keep the extremes of removed records, to find the groups to recompute
+        delta = f"""
+SELECT
+    {sql_list(f"{value} AS {SqlId(col)}" for col, value in groups.items())},
+    {sql_list(f"{agg.change_expression()} AS {SqlId(col)}" for col, agg in aggregates.items())},
+    {sql_list(f"{agg.removed_expression()} AS {SqlId(f'_removed__{col}')}" for col, agg in extremes.items())}
+FROM {data} AS {SqlId(id)}
+{where}
+GROUP BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(groups))}
+HAVING ({sql_list([agg.change_expression() for agg in aggregates.values()] + [agg.removed_expression() for agg in extremes.values()])}) IS DISTINCT FROM ({sql_list([agg.identity_expression() for agg in aggregates.values()] + ["NULL" for _ in extremes])})
+        """.strip()
+        query = f"""
+SELECT {sql_list(group_columns)}, {sql_list(aggregate_columns)}
+FROM _delta
+        """.strip()
+
+    insert = f"""
+INSERT INTO {target_table} AS existing (
+    {sql_list(group_columns)},
+    {sql_list(aggregate_columns)}
+)
+{query}
+{order}
+ON CONFLICT ({sql_list(conflict_columns)}) DO UPDATE
+    SET {sql_list(f'{SqlId(col)} = {agg.combine_expression(col)}' for col, agg in aggregates.items())}
+    """.strip()
+    if extremes:
+        return SqlQuery(insert, expressions=[SqlTableExpr(SqlId("_delta"), delta)])
+    return SqlQuery(insert)
+
+
+def shard_query(
+    aggregates: typing.Dict[str, AggAggregate],
+    groups: typing.Dict[str, str],
+    query: str,
+    target_table: SqlObject,
+) -> SqlQuery:
+    """
+    Apply aggregated changes to a sharded target, skipping locked records
+    """
+    group_columns = [SqlId(col) for col in groups]
+    aggregate_columns = [SqlId(col) for col in aggregates]
+
+    # 1. aggregate changes
+    # 2. lock records where possible
+    # 3. update records
+    # 4. insert for records that have not been updated
+    # Note: #4 does require checking #3 to prevent consideration of locked
+    # dead records.
+    locked = f"""
+SELECT *
+FROM
+  (
+{indent(query, 2)}
+  ) AS d ({sql_list(group_columns + aggregate_columns)})
+  LEFT JOIN LATERAL (
+    SELECT ctid
+    FROM {target_table} AS t
+    WHERE ({table_fields(SqlId("d"), group_columns)}) = ({sql_list(group_columns)})
+    FOR UPDATE SKIP LOCKED
+    LIMIT 1
+  ) AS t ON TRUE
+    """.strip()
+    update = f"""
+UPDATE {target_table} AS existing
+SET {sql_list(f'{SqlId(col)} = {agg.combine_expression(col)}' for col, agg in aggregates.items())}
+FROM locked AS excluded
+WHERE existing.ctid = excluded.ctid
+RETURNING excluded.ctid
+    """.strip()
+    insert = f"""
+INSERT INTO {target_table} ({sql_list(group_columns)}, {sql_list(aggregate_columns)})
+SELECT {sql_list(group_columns)}, {sql_list(aggregate_columns)}
+FROM locked AS l
+  LEFT JOIN update AS u ON l.ctid = u.ctid
+WHERE u.ctid IS NULL
+    """.strip()
+    return SqlQuery(
+        insert,
+        expressions=[
+            SqlTableExpr(SqlId("locked"), locked),
+            SqlTableExpr(SqlId("update"), update),
+        ],
+    )
+
+
+def rollup_change(
+    aggregates: typing.Dict[str, AggAggregate],
+    data: str,
+    filter: typing.Optional[str],
+    groups: typing.Dict[str, str],
+    id: str,
+    rollups: typing.List[AggRollup],
+    target: AggTable,
+    exprs: typing.List[SqlTableExpr] = [],
+) -> typing.Tuple[str, str]:
+    """
+    Apply changed source records to the target and rollups, aggregating them
+    in one pass with GROUPING SETS. Returns the variables and the statements.
+    """
+    targets = [AggRollup(groups=groups, target=target)] + rollups
+
+    # distinct group expressions, identifying each set by its GROUPING bits
+    expressions = []
+    for rollup in targets:
+        for value in rollup.groups.values():
+            if value not in expressions:
+                expressions.append(value)
+    masks = []
+    for rollup in targets:
+        mask = sum(
+            1 << len(expressions) - 1 - i
+            for i, value in enumerate(expressions)
+            if value not in rollup.groups.values()
+        )
+        if mask in masks:
+            raise RuntimeError("Rollups must have different groups.")
+        masks.append(mask)
+
+    aggregate_columns = [SqlId(col) for col in aggregates]
+    where = f"WHERE {filter}" if filter is not None else ""
+
+    delta = f"""
+SELECT
+    {sql_list(f"{value} AS {SqlId(f'_group{i}')}" for i, value in enumerate(expressions))},
+    grouping({sql_list(expressions)}) AS _set,
+    {sql_list(f"{agg.change_expression()} AS {SqlId(col)}" for col, agg in aggregates.items())}
+FROM {data} AS {SqlId(id)}
+{where}
+GROUP BY GROUPING SETS ({sql_list(f"({sql_list(rollup.groups.values())})" for rollup in targets)})
+HAVING ({sql_list(agg.change_expression() for agg in aggregates.values())}) IS DISTINCT FROM ({sql_list(agg.identity_expression() for agg in aggregates.values())})
+    """.strip()
+    query = SqlQuery("", expressions=exprs + [SqlTableExpr(SqlId("_delta"), delta)])
+
+    empties = []
+    deletes = []
+    for i, (rollup, mask) in enumerate(zip(targets, masks)):
+        group_columns = [SqlId(col) for col in rollup.groups]
+        upsert = SqlId(f"_upsert{i}")
+        empty = SqlId(f"_empty{i}")
+        query.expressions.append(
+            SqlTableExpr(
+                upsert,
+                f"""
+INSERT INTO {rollup.target.sql} AS existing (
+    {sql_list(group_columns)},
+    {sql_list(aggregate_columns)}
+)
+SELECT
+    {sql_list(SqlId(f"_group{expressions.index(value)}") for value in rollup.groups.values())},
+    {sql_list(aggregate_columns)}
+FROM _delta
+WHERE _set = {SqlNumber(mask)}
+ORDER BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(rollup.groups))}
+ON CONFLICT ({sql_list(group_columns)}) DO UPDATE
+    SET {sql_list(f'{SqlId(col)} = {agg.combine_expression(col)}' for col, agg in aggregates.items())}
+RETURNING ctid, _count
+                """.strip(),
+            )
+        )
+        empties.append(empty)
+        deletes.append(f"""
+DELETE FROM {rollup.target.sql}
+WHERE ctid = ANY ({empty});
+            """.strip())
+    query.query = f"""
+SELECT
+    {sql_list(f"(SELECT array_agg(ctid) FROM _upsert{i} WHERE _count = 0)" for i, _ in enumerate(targets))}
+INTO {sql_list(empties)}
+    """.strip()
+
+    vars = "\n".join(f"{empty} tid[];" for empty in empties)
+    body = "\n\n".join([f"{str(query).strip()};"] + deletes)
+    return vars, body
+
+
+def delete_empty_vars(aggregates: typing.Dict[str, AggAggregate]) -> str:
+    """
+    Variables for delete_empty
+    """
+    if any(agg.extreme for agg in aggregates.values()):
+        return """
+_empty tid[];
+_stale tid[];
+        """.strip()
+    return "_empty tid[];"
+
+
+def delete_empty(
+    query: SqlQuery,
+    aggregates: typing.Dict[str, AggAggregate],
+    groups: typing.Dict[str, str],
+    target_table: SqlObject,
+    filter: typing.Optional[str] = None,
+    id: typing.Optional[str] = None,
+    source: typing.Optional[AggTable] = None,
+) -> str:
+    """
+    Upsert into the target, and delete the groups whose count reached zero.
+    Then recompute the min and max aggregates whose extreme may have been
+    removed, from the source records of those groups only. Requires the
+    variables from delete_empty_vars.
+    """
+    extremes = {col: agg for col, agg in aggregates.items() if agg.extreme}
+    if not extremes:
+        query.query += "\nRETURNING ctid, _count"
+        query.append(
+            SqlId("_upsert"),
+            "SELECT array_agg(ctid) INTO _empty FROM _upsert WHERE _count = 0",
+        )
+        return f"""
+{str(query).strip()};
+
+DELETE FROM {target_table}
+WHERE ctid = ANY (_empty);
+        """.strip()
+
+    group_columns = [SqlId(col) for col in groups]
+    extreme_columns = [SqlId(col) for col in extremes]
+
+    # the combined value only equals the removed extreme if no changed record
+    # replaced it
+    stale = " OR ".join(
+        f"d.{SqlId(f'_removed__{col}')} {'<=' if agg.kind == AggAggregateKind.MIN else '>='} u.{SqlId(col)}"
+        for col, agg in extremes.items()
+    )
+    query.query += (
+        f"\nRETURNING ctid, {sql_list(group_columns + extreme_columns)}, _count"
+    )
+    query.append(
+        SqlId("_upsert"),
+        f"""
+SELECT
+    array_agg(u.ctid) FILTER (WHERE u._count = 0),
+    array_agg(u.ctid) FILTER (WHERE u._count <> 0 AND ({stale}))
+INTO _empty, _stale
+FROM
+    _upsert AS u
+    JOIN _delta AS d ON ({table_fields(SqlId("u"), group_columns)}) = ({table_fields(SqlId("d"), group_columns)})
+        """.strip(),
+    )
+
+    conditions = [
+        f"({sql_list(groups.values())}) = ({table_fields(SqlId('_target'), group_columns)})"
+    ]
+    if filter is not None:
+        conditions.append(filter)
+    where = " AND ".join(conditions)
+    return f"""
+{str(query).strip()};
+
+DELETE FROM {target_table}
+WHERE ctid = ANY (_empty);
+
+UPDATE {target_table} AS _target
+SET {sql_list(f"{SqlId(col)} = (SELECT {agg.kind.value}({agg.value}) FROM {source.sql} AS {SqlId(id)} WHERE {where})" for col, agg in extremes.items())}
+WHERE _target.ctid = ANY (_stale);
+    """.strip()
+
+
+def change_finalize(
+    consistency: AggConsistency,
+    structure: AggStructure,
+    deferred_storage: AggDeferredStorage = AggDeferredStorage.TEMP,
+) -> str:
+    """
+    After change_query, flag the deferred refresh
+    """
+    if consistency == AggConsistency.DEFERRED:
+        if deferred_storage == AggDeferredStorage.TEMP:
+            refresh_table = structure.refresh_table()
+            pending = f"TABLE {refresh_table}"
+        elif deferred_storage == AggDeferredStorage.UNLOGGED:
+            refresh_table = structure.unlogged_refresh_table()
+            pending = f"SELECT FROM {refresh_table} WHERE txid = txid_current()"
+        return f"""
+IF found THEN
+  INSERT INTO {refresh_table}
+  SELECT
+  WHERE NOT EXISTS ({pending});
+END IF;
+        """.strip()
+    return ""
+
+
 def _create_change_function(
     aggregates: typing.Dict[str, AggAggregate],
     consistency: AggConsistency,
@@ -19,12 +392,14 @@ def _create_change_function(
     structure: AggStructure,
     target: AggTable,
     update: bool,
+    update_columns: typing.Optional[typing.List[str]],
+    bypass: bool = False,
+    deferred_storage: AggDeferredStorage = AggDeferredStorage.TEMP,
+    rollups: typing.List[AggRollup] = [],
 ):
     change_function = (
         structure.change2_function() if update else structure.change1_function()
     )
-    group_columns = [SqlId(col) for col in groups]
-    aggregate_columns = [SqlId(col) for col in aggregates]
 
     setup = f"""
 IF NOT EXISTS (TABLE {"_change1" if update else "_change"}) THEN
@@ -32,28 +407,17 @@ IF NOT EXISTS (TABLE {"_change1" if update else "_change"}) THEN
 END IF;
     """.strip()
 
-    where = f"WHERE {filter}" if filter is not None else ""
-    if consistency == AggConsistency.DEFERRED:
-        setup_function = structure.setup_function()
-        refresh_table = structure.refresh_table()
-        target_table = structure.tmp_table()
-        order = ""
+    if update and update_columns is not None:
+        setting = SqlString(structure.update_columns_setting())
         setup = f"""
-{setup}
-
-PERFORM {setup_function}();
-        """.strip()
-        finalize = f"""
-IF found THEN
-  INSERT INTO {refresh_table}
-  SELECT
-  WHERE NOT EXISTS (TABLE {refresh_table});
+-- skip updates to unwatched columns
+IF current_setting({setting}, true) IS DISTINCT FROM 'on' THEN
+  RETURN NULL;
 END IF;
+PERFORM set_config({setting}, '', true);
+
+{setup}
         """.strip()
-    elif consistency == AggConsistency.IMMEDIATE:
-        target_table = target.sql
-        order = f"ORDER BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(groups))}"
-        finalize = ""
 
     if update:
         data = f"""
@@ -72,63 +436,91 @@ END IF;
 sign smallint := TG_ARGV[0]::smallint;
         """.strip()
 
-    query = f"""
-SELECT
-    {sql_list(value for value in groups.values())},
-    {sql_list(agg.value for agg in aggregates.values())}
-FROM {data} AS {SqlId(id)}
-{where}
-GROUP BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(groups))}
-HAVING ({sql_list(agg.value for agg in aggregates.values())}) IS DISTINCT FROM ({sql_list(agg.identity for agg in aggregates.values())})
-    """.strip()
+    if bypass:
+        if update:
+            staged = f"SELECT * FROM {data} AS _change"
+        else:
+            staged = "SELECT sign, * FROM _change"
+        setup = f"""
+{setup}
 
-    if shard:
-        # 1. aggregate changes
-        # 2. lock records where possible
-        # 3. update records
-        # 4. insert for records that have not been updated
-        # Note: #4 does require checking #3 to prevent consideration of locked
-        # dead records.
-        body = f"""
-WITH
-  locked AS (
-    SELECT *
-    FROM
-      (
-{indent(query, 4)}
-      ) AS d ({sql_list(group_columns + aggregate_columns)})
-      LEFT JOIN LATERAL (
-        SELECT ctid
-        FROM {target_table} AS t
-        WHERE ({table_fields(SqlId("d"), group_columns)}) = ({sql_list(group_columns)})
-        FOR UPDATE SKIP LOCKED
-        LIMIT 1
-      ) AS t ON TRUE
-  ),
-  update AS (
-      UPDATE {target_table} AS existing
-      SET {sql_list(f'{SqlId(col)} = {agg.combine_expression(col)}' for col, agg in aggregates.items())}
-      FROM locked AS excluded
-      WHERE existing.ctid = excluded.ctid
-      RETURNING excluded.ctid
-  )
-INSERT INTO {target_table} ({sql_list(group_columns)}, {sql_list(aggregate_columns)})
-SELECT {sql_list(group_columns)}, {sql_list(aggregate_columns)}
-FROM locked AS l
-  LEFT JOIN update AS u ON l.ctid = u.ctid
-WHERE u.ctid IS NULL;
+IF current_setting({SqlString(structure.bypass_setting())}, true) = 'on' THEN
+  -- stage changes for catchup
+  INSERT INTO {structure.staging_table()}
+  {staged};
+
+  RETURN NULL;
+END IF;
         """.strip()
-    else:
-        body = f"""
-INSERT INTO {target_table} AS existing (
-    {sql_list(group_columns)},
-    {sql_list(aggregate_columns)}
-)
-{query}
-{order}
-ON CONFLICT ({sql_list(group_columns)}) DO UPDATE
-    SET {sql_list(f'{SqlId(col)} = {agg.combine_expression(col)}' for col, agg in aggregates.items())};
+
+    if (
+        consistency == AggConsistency.DEFERRED
+        and deferred_storage == AggDeferredStorage.TEMP
+    ):
+        setup_function = structure.setup_function()
+        setup = f"""
+{setup}
+
+PERFORM {setup_function}();
+        """.strip()
+
+    query = change_query(
+        aggregates=aggregates,
+        consistency=consistency,
+        data=data,
+        deferred_storage=deferred_storage,
+        filter=filter,
+        groups=groups,
+        id=id,
+        shard=shard,
+        structure=structure,
+        target=target,
+    )
+    if rollups:
+        rollup_vars, body = rollup_change(
+            aggregates=aggregates,
+            data=data,
+            filter=filter,
+            groups=groups,
+            id=id,
+            rollups=rollups,
+            target=target,
+        )
+        vars = f"""
+{vars}
+{rollup_vars}
+        """.strip()
+    elif consistency == AggConsistency.IMMEDIATE and not shard:
+        body = delete_empty(
+            query,
+            aggregates=aggregates,
+            filter=filter,
+            groups=groups,
+            id=id,
+            source=source,
+            target_table=target.sql,
+        )
+        vars = f"""
+{vars}
+{delete_empty_vars(aggregates)}
         """.strip()
+        if distinct_aggregates(aggregates):
+            body = f"""
+{body}
+
+{distinct_change(aggregates=aggregates, data=data, filter=filter, groups=groups, id=id, structure=structure, target=target)}
+            """.strip()
+            vars = f"""
+{vars}
+_unreferenced tid[];
+            """.strip()
+    else:
+        body = f"{str(query).strip()};"
+    finalize = change_finalize(
+        consistency=consistency,
+        deferred_storage=deferred_storage,
+        structure=structure,
+    )
 
     yield f"""
 CREATE FUNCTION {change_function} () RETURNS trigger
@@ -183,17 +575,71 @@ def create_change(
     source: AggTable,
     structure: AggStructure,
     target: AggTable,
+    update_columns: typing.Optional[typing.List[str]],
+    bypass: bool = False,
+    deferred_storage: AggDeferredStorage = AggDeferredStorage.TEMP,
+    rollups: typing.List[AggRollup] = [],
 ):
+    if update_columns is None:
+        update_columns = _update_columns(
+            aggregates=aggregates,
+            filter=filter,
+            groups=groups,
+            id=id,
+            rollups=rollups,
+        )
+
     for update in [False, True]:
         yield from _create_change_function(
             aggregates=aggregates,
+            bypass=bypass,
             consistency=consistency,
+            deferred_storage=deferred_storage,
             filter=filter,
             groups=groups,
             id=id,
+            rollups=rollups,
             shard=shard,
             source=source,
             structure=structure,
             target=target,
             update=update,
+            update_columns=update_columns,
+        )
+
+    if update_columns is not None:
+        yield from _create_update_columns(
+            columns=update_columns, id=id, source=source, structure=structure
         )
+
+
+def _create_update_columns(
+    columns: typing.List[str],
+    id: str,
+    source: AggTable,
+    structure: AggStructure,
+):
+    # column-specific triggers cannot reference transition tables, so this
+    # only flags the update trigger (which sorts after it)
+    function = structure.update_columns_function()
+    trigger = structure.update_columns_trigger()
+
+    yield f"""
+CREATE FUNCTION {function} () RETURNS trigger
+LANGUAGE plpgsql AS $$
+  BEGIN
+    PERFORM set_config({SqlString(structure.update_columns_setting())}, 'on', true);
+
+    RETURN NULL;
+  END;
+$$
+    """.strip()
+
+    yield f"""
+COMMENT ON FUNCTION {function} IS {SqlString(f'Flag updates to watched columns for {id}')}
+    """.strip()
+
+    yield f"""
+CREATE TRIGGER {trigger} AFTER UPDATE OF {sql_list(SqlId(column) for column in columns)} ON {source.sql}
+FOR EACH STATEMENT EXECUTE PROCEDURE {function}()
+    """.strip()
@@ -7,77 +7,139 @@ from .formats.agg import AggAggregate, AggTable
 from .sql import table_fields
 
 
-def create_cleanup(
+def create_compress(
     id: str,
+    aggregates: typing.Dict[str, AggAggregate],
     groups: typing.Dict[str, str],
-    shard: bool,
+    shard: typing.Dict[str, str],
     structure: AggStructure,
     target: AggTable,
 ):
-    cleanup_function = structure.cleanup_function()
-    cleanup_trigger = structure.cleanup_trigger()
+    compress_function = structure.compress_function()
     group_columns = [SqlId(group) for group in groups]
 
     yield f"""
-CREATE FUNCTION {cleanup_function} () RETURNS trigger
+CREATE FUNCTION {compress_function} () RETURNS void
 LANGUAGE plpgsql AS $$
   BEGIN
-    DELETE FROM {target.sql} AS t
-    USING _new AS n
-    WHERE
-      ({table_fields(SqlId("t"), group_columns)}) = ({table_fields(SqlId("n"), group_columns)})
-      AND n._count = 0;
-
-    RETURN NULL;
+    WITH
+      data AS (
+        DELETE FROM {target.sql}
+        RETURNING *
+      )
+    INSERT INTO {target.sql} ({sql_list(list(groups) + list(shard))})
+    SELECT
+        {sql_list(list(groups) + list(shard.values()))}
+    FROM data
+    GROUP BY {sql_list([SqlNumber(i + 1) for i in range(len(groups))])}
+    HAVING ({sql_list(shard.values())}) IS DISTINCT FROM ({sql_list(aggregates[name].identity_expression() for name in shard)});
   END;
 $$
     """.strip()
 
     yield f"""
-COMMENT ON FUNCTION {cleanup_function} IS {SqlString(f'Cleanup records for {id}')}
+COMMENT ON FUNCTION {compress_function} IS {SqlString(f'Compress aggregate for {id}')}
     """.strip()
 
+
+def create_compact(
+    id: str,
+    aggregates: typing.Dict[str, AggAggregate],
+    groups: typing.Dict[str, str],
+    shard: typing.Dict[str, str],
+    structure: AggStructure,
+    target: AggTable,
+):
+    """
+    Merge the shards of groups incrementally, unlike compress
+    """
+    compact_function = structure.compact_function()
+    group_columns = [SqlId(group) for group in groups]
+
     yield f"""
-CREATE TRIGGER {cleanup_trigger} AFTER UPDATE ON {target.sql}
-REFERENCING NEW TABLE AS _new
-FOR EACH STATEMENT EXECUTE PROCEDURE {cleanup_function}()
+CREATE FUNCTION {compact_function} (max_groups int, max_time interval DEFAULT NULL, min_shards int DEFAULT 2, OUT merged int, OUT removed bigint)
+LANGUAGE plpgsql AS $$
+  DECLARE
+    _ctids tid[];
+    _group record;
+    _inserted int;
+    _start timestamptz := clock_timestamp();
+  BEGIN
+    merged := 0;
+    removed := 0;
+
+    FOR _group IN
+      SELECT {table_fields(SqlId("t"), group_columns)}
+      FROM {target.sql} AS t
+      GROUP BY {sql_list([SqlNumber(i + 1) for i in range(len(groups))])}
+      HAVING greatest(min_shards, 2) <= count(*)
+      ORDER BY {sql_list([SqlNumber(i + 1) for i in range(len(groups))])}
+    LOOP
+      EXIT WHEN max_groups <= merged;
+      EXIT WHEN max_time <= clock_timestamp() - _start;
+
+      -- skip shards locked by writers or other compactions
+      _ctids := ARRAY(
+        SELECT t.ctid
+        FROM {target.sql} AS t
+        WHERE ({table_fields(SqlId("t"), group_columns)}) = ({table_fields(SqlId("_group"), group_columns)})
+        FOR UPDATE SKIP LOCKED
+      );
+      CONTINUE WHEN cardinality(_ctids) < 2;
+
+      WITH
+        data AS (
+          DELETE FROM {target.sql} AS t
+          WHERE t.ctid = ANY (_ctids)
+          RETURNING *
+        )
+      INSERT INTO {target.sql} ({sql_list(list(groups) + list(shard))})
+      SELECT
+          {sql_list(list(groups) + list(shard.values()))}
+      FROM data
+      GROUP BY {sql_list([SqlNumber(i + 1) for i in range(len(groups))])}
+      HAVING ({sql_list(shard.values())}) IS DISTINCT FROM ({sql_list(aggregates[name].identity_expression() for name in shard)});
+      GET DIAGNOSTICS _inserted = ROW_COUNT;
+
+      merged := merged + 1;
+      removed := removed + cardinality(_ctids) - _inserted;
+    END LOOP;
+  END;
+$$
     """.strip()
 
     yield f"""
-COMMENT ON TRIGGER {cleanup_trigger} ON {target.sql} IS {SqlString(f'Cleanup records for {id}')}
+COMMENT ON FUNCTION {compact_function} IS {SqlString(f'Compact shards of up to max_groups groups for {id}')}
     """.strip()
 
 
-def create_compress(
+def create_shard_stats(
     id: str,
-    aggregates: typing.Dict[str, AggAggregate],
     groups: typing.Dict[str, str],
-    shard: typing.Dict[str, str],
     structure: AggStructure,
     target: AggTable,
 ):
-    compress_function = structure.compress_function()
+    """
+    Measure the shards per group, for compaction
+    """
+    shard_stats_function = structure.shard_stats_function()
     group_columns = [SqlId(group) for group in groups]
 
     yield f"""
-CREATE FUNCTION {compress_function} () RETURNS void
+CREATE FUNCTION {shard_stats_function} (OUT groups bigint, OUT shards bigint, OUT max_shards bigint)
 LANGUAGE plpgsql AS $$
   BEGIN
-    WITH
-      data AS (
-        DELETE FROM {target.sql}
-        RETURNING *
-      )
-    INSERT INTO {target.sql} ({sql_list(list(groups) + list(shard))})
-    SELECT
-        {sql_list(list(groups) + list(shard.values()))}
-    FROM data
-    GROUP BY {sql_list([SqlNumber(i + 1) for i in range(len(groups))])}
-    HAVING ({sql_list(shard.values())}) IS DISTINCT FROM ({sql_list(aggregates[name].identity for name in shard)});
+    SELECT count(*), coalesce(sum(s.count), 0), coalesce(max(s.count), 0)
+    INTO groups, shards, max_shards
+    FROM (
+      SELECT count(*)
+      FROM {target.sql} AS t
+      GROUP BY {table_fields(SqlId("t"), group_columns)}
+    ) AS s;
   END;
 $$
     """.strip()
 
     yield f"""
-COMMENT ON FUNCTION {compress_function} IS {SqlString(f'Compress aggregate for {id}')}
+COMMENT ON FUNCTION {shard_stats_function} IS {SqlString(f'Count groups and shards for {id}')}
     """.strip()
@@ -18,6 +18,15 @@ class AggStructure:
             else SqlObject(name)
         )
 
+    def bypass_setting(self) -> str:
+        return f"denorm.{self._id}__bypass"
+
+    def catchup_function(self) -> SqlObject:
+        return self._sql_object(self._name("catchup"))
+
+    def staging_table(self) -> SqlObject:
+        return self._sql_object(self._name("stg"))
+
     def change1_function(self) -> SqlObject:
         return self._sql_object(self._name("change1"))
 
@@ -30,21 +39,39 @@ class AggStructure:
     def update_trigger(self) -> SqlObject:
         return self._sql_object(self._name("upd"))
 
+    def update_columns_function(self) -> SqlObject:
+        return self._sql_object(self._name("upc"))
+
+    def update_columns_setting(self) -> str:
+        return f"denorm.{self._id}__upc"
+
+    def update_columns_trigger(self) -> SqlId:
+        return self._name("upc")
+
     def delete_trigger(self) -> SqlObject:
         return self._sql_object(self._name("del"))
 
-    def cleanup_function(self) -> SqlObject:
-        return self._sql_object(self._name("cleanup"))
+    def distinct_table(self, name: str) -> SqlObject:
+        return self._sql_object(self._name(f"dst__{name}"))
 
-    def cleanup_trigger(self) -> SqlId:
-        return self._name("cleanup")
+    def compact_function(self) -> SqlObject:
+        return self._sql_object(self._name("compact"))
 
     def compress_function(self) -> SqlObject:
         return self._sql_object(self._name("compress"))
 
+    def shard_stats_function(self) -> SqlObject:
+        return self._sql_object(self._name("shard_stats"))
+
     def refresh_constraint(self) -> SqlId:
         return SqlId(self._id)
 
+    def flush_function(self) -> SqlObject:
+        return self._sql_object(self._name("flush"))
+
+    def unlogged_refresh_constraint(self) -> SqlObject:
+        return self._sql_object(self.refresh_constraint())
+
     def refresh_function(self) -> SqlObject:
         return self._sql_object(self._name("refresh"))
 
@@ -56,3 +83,9 @@ class AggStructure:
 
     def tmp_table(self) -> SqlObject:
         return SqlObject(SqlId("pg_temp"), self._name("tmp"))
+
+    def unlogged_refresh_table(self) -> SqlObject:
+        return self._sql_object(self._name("pending"))
+
+    def unlogged_tmp_table(self) -> SqlObject:
+        return self._sql_object(self._name("tmp"))
@@ -1,9 +1,12 @@
 import typing
 
-from pg_sql import SqlId, SqlNumber, SqlString, sql_list
+from pg_sql import SqlId, SqlNumber, SqlObject, SqlString, sql_list
 
+from .agg_change import delete_empty, delete_empty_vars, shard_query
 from .agg_common import AggStructure
-from .formats.agg import AggAggregate, AggConfig, AggTable
+from .formats.agg import AggAggregate, AggConfig, AggDeferredStorage, AggTable
+from .sql import SqlQuery, SqlTableExpr
+from .string import indent
 
 
 def create_refresh_function(
@@ -12,35 +15,97 @@ def create_refresh_function(
     aggregates: typing.Dict[str, AggAggregate],
     groups: typing.Dict[str, str],
     target: AggTable,
+    deferred_storage: AggDeferredStorage = AggDeferredStorage.TEMP,
+    shard: bool = False,
 ):
     refresh_function = structure.refresh_function()
-    refresh_table = structure.refresh_table()
-    tmp_table = structure.tmp_table()
     group_columns = [SqlId(col) for col in groups]
     aggregate_columns = [SqlId(col) for col in aggregates]
 
+    if deferred_storage == AggDeferredStorage.TEMP:
+        refresh_table = structure.refresh_table()
+        tmp_table = structure.tmp_table()
+        where = ""
+    elif deferred_storage == AggDeferredStorage.UNLOGGED:
+        refresh_table = structure.unlogged_refresh_table()
+        tmp_table = structure.unlogged_tmp_table()
+        where = "WHERE txid = txid_current()"
+
+    if shard:
+        # write the folded changes with the same skip locked path as
+        # immediate changes
+        conditions = [
+            f"({sql_list(aggregate_columns)}) IS DISTINCT FROM ({sql_list(agg.identity_expression() for agg in aggregates.values())})"
+        ]
+        if deferred_storage == AggDeferredStorage.UNLOGGED:
+            conditions.insert(0, "txid = txid_current()")
+        changes = f"""
+SELECT
+    {sql_list(group_columns)},
+    {sql_list(aggregate_columns)}
+FROM {tmp_table}
+WHERE {" AND ".join(conditions)}
+        """.strip()
+        query = shard_query(
+            aggregates=aggregates,
+            groups=groups,
+            query=changes,
+            target_table=target.sql,
+        )
+        query.prepend(
+            SqlTableExpr(
+                SqlId("_delete"),
+                f"""
+DELETE FROM {tmp_table}
+{where}
+RETURNING *
+                """.strip(),
+            )
+        )
+        apply = f"{str(query).strip()};"
+        vars = ""
+    else:
+        query = SqlQuery(
+            f"""
+INSERT INTO {target.sql} AS existing (
+  {sql_list(group_columns)},
+  {sql_list(aggregate_columns)}
+)
+SELECT
+  {sql_list(group_columns)},
+  {sql_list(aggregate_columns)}
+FROM {tmp_table}
+{where}
+ORDER BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(groups))}
+ON CONFLICT ({sql_list(group_columns)}) DO UPDATE
+  SET {sql_list(f'{SqlId(col)} = {agg.combine_expression(col)}' for col, agg in aggregates.items())}
+            """.strip(),
+            expressions=[
+                SqlTableExpr(
+                    SqlId("_delete"),
+                    f"""
+DELETE FROM {tmp_table}
+{where}
+RETURNING *
+                    """.strip(),
+                )
+            ],
+        )
+        apply = delete_empty(
+            query, aggregates=aggregates, groups=groups, target_table=target.sql
+        )
+        vars = delete_empty_vars(aggregates)
+
     yield f"""
 CREATE FUNCTION {refresh_function} () RETURNS trigger
 LANGUAGE plpgsql AS $$
+  DECLARE
+    {vars}
   BEGIN
-    DELETE FROM {refresh_table};
-
-    WITH
-      _delete AS (
-        DELETE FROM {tmp_table}
-        RETURNING *
-      )
-    INSERT INTO {target.sql} AS existing (
-      {sql_list(group_columns)},
-      {sql_list(aggregate_columns)}
-    )
-    SELECT
-      {sql_list(group_columns)},
-      {sql_list(aggregate_columns)}
-    FROM {tmp_table}
-    ORDER BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(groups))}
-    ON CONFLICT ({sql_list(group_columns)}) DO UPDATE
-      SET {sql_list(f'{SqlId(col)} = {agg.combine_expression(col)}' for col, agg in aggregates.items())};
+    DELETE FROM {refresh_table}
+    {where};
+
+{indent(apply, 2)}
 
     RETURN NULL;
   END;
@@ -48,6 +113,45 @@ $$
     """.strip()
 
 
+def create_flush_function(
+    id: str,
+    structure: AggStructure,
+    storage: AggDeferredStorage = AggDeferredStorage.TEMP,
+):
+    """
+    Apply deferred changes immediately, by firing the pending refresh
+    """
+    flush_function = structure.flush_function()
+
+    if storage == AggDeferredStorage.TEMP:
+        constraint = SqlObject(SqlId("pg_temp"), structure.refresh_constraint())
+        # without the temp tables, there is nothing to flush
+        check = f"""
+IF to_regclass({SqlString(str(structure.refresh_table()))}) IS NULL THEN
+  RETURN;
+END IF;
+        """.strip()
+    elif storage == AggDeferredStorage.UNLOGGED:
+        constraint = structure.unlogged_refresh_constraint()
+        check = ""
+
+    yield f"""
+CREATE FUNCTION {flush_function} () RETURNS void
+LANGUAGE plpgsql AS $$
+  BEGIN
+{indent(check, 2)}
+
+    SET CONSTRAINTS {constraint} IMMEDIATE;
+    SET CONSTRAINTS {constraint} DEFERRED;
+  END;
+$$
+    """.strip()
+
+    yield f"""
+COMMENT ON FUNCTION {flush_function} IS {SqlString(f"Apply deferred changes for {id}")}
+    """.strip()
+
+
 def create_setup_function(
     id: str,
     structure: AggStructure,
@@ -96,3 +200,60 @@ $$
     yield f"""
 COMMENT ON FUNCTION {setup_function} IS {SqlString(f"Set up temp tables for {id}")}
     """.strip()
+
+
+def create_unlogged_tables(
+    id: str,
+    structure: AggStructure,
+    aggregates: typing.Dict[str, AggAggregate],
+    groups: typing.Dict[str, str],
+    target: AggTable,
+):
+    """
+    Create tables shared by all sessions, as an alternative to the setup
+    function. Rows are identified by transaction.
+    """
+    refresh_constraint = structure.refresh_constraint()
+    refresh_function = structure.refresh_function()
+    refresh_table = structure.unlogged_refresh_table()
+    tmp_table = structure.unlogged_tmp_table()
+
+    group_columns = [SqlId(col) for col in groups]
+    aggregate_columns = [SqlId(col) for col in aggregates]
+
+    yield f"""
+CREATE UNLOGGED TABLE {tmp_table}
+AS SELECT
+  NULL::bigint AS txid,
+  {sql_list(group_columns)},
+  {sql_list(aggregate_columns)}
+FROM {target.sql}
+WITH NO DATA
+    """.strip()
+
+    yield f"""
+ALTER TABLE {tmp_table}
+  ALTER txid SET DEFAULT txid_current(),
+  ALTER txid SET NOT NULL,
+  ADD PRIMARY KEY (txid, {sql_list(group_columns)})
+    """.strip()
+
+    yield f"""
+COMMENT ON TABLE {tmp_table} IS {SqlString(f"Changes to apply at the end of each transaction for {id}")}
+    """.strip()
+
+    yield f"""
+CREATE UNLOGGED TABLE {refresh_table} (
+  txid bigint DEFAULT txid_current() PRIMARY KEY
+)
+    """.strip()
+
+    yield f"""
+COMMENT ON TABLE {refresh_table} IS {SqlString(f"Transactions to refresh for {id}")}
+    """.strip()
+
+    yield f"""
+CREATE CONSTRAINT TRIGGER {refresh_constraint} AFTER INSERT ON {refresh_table}
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE PROCEDURE {refresh_function}()
+    """.strip()
@@ -0,0 +1,135 @@
+import typing
+
+from pg_sql import SqlId, SqlNumber, SqlString, sql_list
+
+from .agg_common import AggStructure
+from .formats.agg import AggAggregate, AggAggregateKind, AggTable
+from .sql import table_fields
+
+
+def distinct_aggregates(
+    aggregates: typing.Dict[str, AggAggregate],
+) -> typing.Dict[str, AggAggregate]:
+    return {
+        name: aggregate
+        for name, aggregate in aggregates.items()
+        if aggregate.kind == AggAggregateKind.DISTINCT
+    }
+
+
+def create_distinct_tables(
+    id: str,
+    aggregates: typing.Dict[str, AggAggregate],
+    filter: typing.Optional[str],
+    groups: typing.Dict[str, str],
+    source: AggTable,
+    structure: AggStructure,
+):
+    """
+    Create and populate the reference counts of distinct values
+    """
+    group_columns = [SqlId(col) for col in groups]
+
+    for name, aggregate in distinct_aggregates(aggregates).items():
+        table = structure.distinct_table(name)
+        conditions = [f"{aggregate.value} IS NOT NULL"]
+        if filter is not None:
+            conditions.insert(0, filter)
+
+        yield f"""
+CREATE TABLE {table}
+AS SELECT
+  {sql_list(f"{value} AS {SqlId(col)}" for col, value in groups.items())},
+  {aggregate.value} AS _value,
+  count(*) AS _count
+FROM {source.sql} AS {SqlId(id)}
+WHERE {" AND ".join(conditions)}
+GROUP BY {sql_list(SqlNumber(i + 1) for i in range(len(groups) + 1))}
+        """.strip()
+
+        yield f"""
+ALTER TABLE {table}
+  ADD PRIMARY KEY ({sql_list(group_columns)}, _value)
+        """.strip()
+
+        yield f"""
+COMMENT ON TABLE {table} IS {SqlString(f"Reference counts of {name} values for {id}")}
+        """.strip()
+
+
+def distinct_change(
+    aggregates: typing.Dict[str, AggAggregate],
+    data: str,
+    filter: typing.Optional[str],
+    groups: typing.Dict[str, str],
+    id: str,
+    structure: AggStructure,
+    target: AggTable,
+) -> str:
+    """
+    Apply changed source records to the reference counts, and change the
+    distinct counts of the target by values whose count crosses zero. Requires
+    an _unreferenced tid[] variable.
+    """
+    group_columns = [SqlId(col) for col in groups]
+    order = sql_list(SqlNumber(i + 1) for i in range(len(groups) + 1))
+
+    statements = []
+    for name, aggregate in distinct_aggregates(aggregates).items():
+        table = structure.distinct_table(name)
+        conditions = [f"{aggregate.value} IS NOT NULL"]
+        if filter is not None:
+            conditions.insert(0, filter)
+
+        # groups whose count reached zero have been deleted
+        statements.append(f"""
+WITH
+  _ref_change AS (
+    SELECT
+      {sql_list(f"{value} AS {SqlId(col)}" for col, value in groups.items())},
+      {aggregate.value} AS _value,
+      sum(sign) AS _count
+    FROM {data} AS {SqlId(id)}
+    WHERE {" AND ".join(conditions)}
+    GROUP BY {order}
+    HAVING sum(sign) <> 0
+  ),
+  _ref AS (
+    INSERT INTO {table} AS existing ({sql_list(group_columns)}, _value, _count)
+    SELECT *
+    FROM _ref_change
+    ORDER BY {order}
+    ON CONFLICT ({sql_list(group_columns)}, _value) DO UPDATE
+      SET _count = existing._count + excluded._count
+    RETURNING ctid, {sql_list(group_columns)}, _value, _count
+  ),
+  _ref_delta AS (
+    SELECT
+      {table_fields(SqlId("r"), group_columns)},
+      sum(
+        CASE
+          WHEN 0 < r._count AND r._count - c._count <= 0 THEN 1
+          WHEN r._count <= 0 AND 0 < r._count - c._count THEN -1
+          ELSE 0
+        END
+      ) AS _delta
+    FROM
+      _ref AS r
+      JOIN _ref_change AS c ON ({table_fields(SqlId("r"), group_columns)}, r._value) = ({table_fields(SqlId("c"), group_columns)}, c._value)
+    GROUP BY {sql_list(SqlNumber(i + 1) for i in range(len(groups)))}
+  ),
+  _update AS (
+    UPDATE {target.sql} AS t
+    SET {SqlId(name)} = t.{SqlId(name)} + d._delta
+    FROM _ref_delta AS d
+    WHERE
+      ({table_fields(SqlId("t"), group_columns)}) = ({table_fields(SqlId("d"), group_columns)})
+      AND d._delta <> 0
+  )
+SELECT array_agg(ctid) INTO _unreferenced FROM _ref WHERE _count <= 0;
+
+DELETE FROM {table}
+WHERE ctid = ANY (_unreferenced);
+        """.strip())
+
+    return "\n\n".join(statements)
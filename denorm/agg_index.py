@@ -0,0 +1,34 @@
+from pg_sql import SqlId, sql_list
+
+from .formats.agg import AggConfig
+from .sql import create_index
+
+
+def create_indexes(config: AggConfig):
+    """
+    Create index for the target groups, and for the source groups and values
+    of min and max aggregates
+    """
+    yield create_index(
+        config.target.sql,
+        config.target.name,
+        list(config.groups),
+        unique=not config.shard,
+    )
+
+    for rollup in config.rollups:
+        yield create_index(
+            rollup.target.sql,
+            rollup.target.name,
+            list(rollup.groups),
+            unique=True,
+        )
+
+    for name, aggregate in config.aggregates.items():
+        if not aggregate.extreme:
+            continue
+        index = SqlId(f"{config.source.name}_{config.id}_{name}_idx")
+        expressions = list(config.groups.values()) + [aggregate.value]
+        yield f"""
+CREATE INDEX IF NOT EXISTS {index} ON {config.source.sql} ({sql_list(f"({expression})" for expression in expressions)})
+        """.strip()
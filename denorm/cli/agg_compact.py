@@ -0,0 +1,32 @@
+import logging
+import signal
+
+import psycopg2
+
+from ..compactor import Compactor, CompactorIo
+from .common import open_str_read
+
+
+def cli(args):
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s",
+        level=logging.INFO,
+    )
+
+    io = CompactorIo(
+        configs=[lambda path=path: open_str_read(path) for path in args.schema],
+        connect=lambda: psycopg2.connect(args.dsn),
+    )
+    compactor = Compactor(
+        io,
+        max_groups=args.max_groups,
+        max_rate=args.max_rate,
+        max_time=args.max_time,
+        poll_interval=args.poll_interval,
+        target=args.target,
+    )
+
+    signal.signal(signal.SIGINT, lambda *_: compactor.stop())
+    signal.signal(signal.SIGTERM, lambda *_: compactor.stop())
+
+    compactor.run()
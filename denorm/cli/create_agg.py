@@ -7,4 +7,4 @@ def cli(args):
         config=lambda: open_str_read(args.schema),
         output=lambda: open_str_write(args.output),
     )
-    create_agg(io)
+    create_agg(io, indexes=args.indexes)
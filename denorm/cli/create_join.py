@@ -1,10 +1,19 @@
-from ..join import JoinIo, create_join
+from ..join import JoinIo, JoinsIo, create_join, create_joins
 from .common import open_str_read, open_str_write
 
 
 def cli(args):
-    io = JoinIo(
-        config=lambda: open_str_read(args.schema),
-        output=lambda: open_str_write(args.output),
-    )
-    create_join(io)
+    schemas = args.schema or ["-"]
+
+    if len(schemas) == 1:
+        io = JoinIo(
+            config=lambda: open_str_read(schemas[0]),
+            output=lambda: open_str_write(args.output),
+        )
+        create_join(io, indexes=args.indexes)
+    else:
+        io = JoinsIo(
+            configs=[lambda path=path: open_str_read(path) for path in schemas],
+            output=lambda: open_str_write(args.output),
+        )
+        create_joins(io, id=args.id, indexes=args.indexes)
@@ -7,6 +7,10 @@ def main():
     parser = _create_parser()
     args = parser.parse_args()
 
+    if args.command == "agg-compact":
+        from .agg_compact import cli
+
+        cli(args)
     if args.command == "create-agg":
         from .create_agg import cli
 
@@ -15,6 +19,10 @@ def main():
         from .create_join import cli
 
         cli(args)
+    if args.command == "worker":
+        from .worker import cli
+
+        cli(args)
 
 
 def _create_parser():
@@ -30,19 +38,78 @@ def _create_parser():
 
     subparsers = parser.add_subparsers(dest="command")
 
+    _add_agg_compact_command(subparsers)
     _add_create_agg_command(subparsers)
     _add_create_join_command(subparsers)
+    _add_worker_command(subparsers)
 
     return parser
 
 
+def _add_agg_compact_command(subparsers):
+    parser = subparsers.add_parser("agg-compact")
+    parser.add_argument(
+        "--schema", action="append", required=True, help="agg schema (repeatable)"
+    )
+    parser.add_argument(
+        "--dsn", default="", help="connection string, defaults to libpq variables"
+    )
+    parser.add_argument(
+        "--max-groups", default=1000, type=int, help="groups per compact call"
+    )
+    parser.add_argument(
+        "--max-rate", type=float, help="maximum shards removed per second"
+    )
+    parser.add_argument(
+        "--max-time", default=1, type=float, help="seconds per compact call"
+    )
+    parser.add_argument(
+        "--poll-interval", default=60, type=float, help="seconds between stats"
+    )
+    parser.add_argument(
+        "--target", default=1, type=float, help="shards per group to allow"
+    )
+
+
 def _add_create_agg_command(subparsers):
     parser = subparsers.add_parser("create-agg")
     parser.add_argument("--schema", default="-")
     parser.add_argument("--output", default="-")
+    parser.add_argument("--indexes", action="store_true", help="output indexes instead")
 
 
 def _add_create_join_command(subparsers):
     parser = subparsers.add_parser("create-join")
-    parser.add_argument("--schema", default="-")
+    parser.add_argument(
+        "--schema", action="append", help="schema, repeat to share triggers"
+    )
     parser.add_argument("--output", default="-")
+    parser.add_argument(
+        "--id", default="denorm", help="ID for triggers shared by schemas"
+    )
+    parser.add_argument("--indexes", action="store_true", help="output indexes instead")
+
+
+def _add_worker_command(subparsers):
+    parser = subparsers.add_parser("worker")
+    parser.add_argument(
+        "--schema", action="append", required=True, help="join schema (repeatable)"
+    )
+    parser.add_argument(
+        "--dsn", default="", help="connection string, defaults to libpq variables"
+    )
+    parser.add_argument(
+        "--concurrency", default=1, type=int, help="number of connections"
+    )
+    parser.add_argument(
+        "--max-items", default=1, type=int, help="queue items per process call"
+    )
+    parser.add_argument(
+        "--max-records", default=1000, type=int, help="records per queue item"
+    )
+    parser.add_argument(
+        "--poll-interval", default=1, type=float, help="seconds between polls"
+    )
+    parser.add_argument(
+        "--poll-max", default=60, type=float, help="maximum seconds between polls"
+    )
@@ -0,0 +1,32 @@
+import logging
+import signal
+
+import psycopg2
+
+from ..worker import Worker, WorkerIo
+from .common import open_str_read
+
+
+def cli(args):
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(threadName)s %(message)s",
+        level=logging.INFO,
+    )
+
+    io = WorkerIo(
+        configs=[lambda path=path: open_str_read(path) for path in args.schema],
+        connect=lambda: psycopg2.connect(args.dsn),
+    )
+    worker = Worker(
+        io,
+        concurrency=args.concurrency,
+        max_items=args.max_items,
+        max_records=args.max_records,
+        poll_interval=args.poll_interval,
+        poll_max=args.poll_max,
+    )
+
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+
+    worker.run()
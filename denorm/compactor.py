@@ -0,0 +1,152 @@
+"""
+Compactor for sharded aggregates.
+
+Each round measures the shards per group with ID__shard_stats. If there are
+more shards per group than the target, it calls ID__compact for the most
+fragmented groups first, halving min_shards down to 2, and sleeps to keep the
+removed shards within the rate.
+"""
+
+import dataclasses
+import datetime
+import logging
+import threading
+import typing
+
+from pg_sql import SqlObject
+
+from .agg_common import AggStructure
+from .formats.agg import AGG_DATA_JSON_FORMAT, AggConfig
+from .resource import ResourceFactory
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CompactorAgg(typing.NamedTuple):
+    id: str
+    compact_function: SqlObject
+    shard_stats_function: SqlObject
+
+
+def compactor_aggs(config: AggConfig) -> typing.List[CompactorAgg]:
+    """
+    Find the aggregate if it can be compacted
+    """
+    if type(config.shard) != dict:
+        return []
+
+    structure = AggStructure(config.schema, config.id)
+
+    return [
+        CompactorAgg(
+            id=config.id,
+            compact_function=structure.compact_function(),
+            shard_stats_function=structure.shard_stats_function(),
+        )
+    ]
+
+
+@dataclasses.dataclass
+class CompactorIo:
+    configs: typing.List[ResourceFactory[typing.TextIO]]
+    connect: typing.Callable[[], typing.Any]
+
+
+class Compactor:
+    def __init__(
+        self,
+        io: CompactorIo,
+        max_groups: int = 1000,
+        max_rate: typing.Optional[float] = None,
+        max_time: float = 1,
+        poll_interval: float = 60,
+        target: float = 1,
+    ):
+        self._io = io
+        self._max_groups = max_groups
+        self._max_rate = max_rate
+        self._max_time = datetime.timedelta(seconds=max_time)
+        self._poll_interval = poll_interval
+        self._target = target
+        self._stopped = threading.Event()
+        self._aggs = [
+            agg
+            for config in io.configs
+            for agg in compactor_aggs(AGG_DATA_JSON_FORMAT.load(config))
+        ]
+
+    def stop(self):
+        """
+        Stop after the current call finishes. Safe to call from a signal handler.
+        """
+        self._stopped.set()
+
+    def run(self):
+        if not self._aggs:
+            raise RuntimeError("No sharded aggregates to compact")
+
+        conn = None
+        while not self._stopped.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                for agg in self._aggs:
+                    self._compact(conn, agg)
+            except Exception:
+                _LOGGER.exception("Failed to compact")
+                conn = self._close(conn)
+            self._stopped.wait(self._poll_interval)
+        self._close(conn)
+
+    def _compact(self, conn, agg: CompactorAgg):
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT groups, shards, max_shards FROM {agg.shard_stats_function}()"
+            )
+            groups, shards, max_shards = cur.fetchone()
+        _LOGGER.info(
+            "%s has %s groups, %s shards, at most %s per group",
+            agg.id,
+            groups,
+            shards,
+            max_shards,
+        )
+        if shards <= groups * self._target:
+            return
+
+        min_shards = max_shards
+        while not self._stopped.is_set():
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT merged, removed FROM {agg.compact_function}(%s, %s, %s)",
+                    (self._max_groups, self._max_time, min_shards),
+                )
+                merged, removed = cur.fetchone()
+            _LOGGER.info(
+                "%s merged %s groups of at least %s shards, removing %s shards",
+                agg.id,
+                merged,
+                min_shards,
+                removed,
+            )
+
+            if self._max_rate is not None and removed:
+                self._stopped.wait(removed / self._max_rate)
+
+            if not merged:
+                if min_shards <= 2:
+                    break
+                min_shards = max(min_shards // 2, 2)
+
+    def _connect(self):
+        conn = self._io.connect()
+        conn.autocommit = True
+        return conn
+
+    def _close(self, conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return None
@@ -0,0 +1,16 @@
+import typing
+
+from pg_sql import SqlId, SqlObject
+
+
+def flush(cur, id: str, schema: typing.Optional[str] = None):
+    """
+    Apply the deferred changes of a join or aggregate, within the current
+    transaction
+    """
+    function = SqlId(f"{id}__flush")
+    if schema is not None:
+        function = SqlObject(SqlId(schema), function)
+    else:
+        function = SqlObject(function)
+    cur.execute(f"SELECT {function}()")
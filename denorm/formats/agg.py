@@ -8,11 +8,23 @@ from pg_sql import SqlId, SqlObject
 from ..json import DataJsonFormat, ValidatingDataJsonFormat, package_json_format
 
 
+class AggAggregateKind(enum.Enum):
+    DISTINCT = "distinct"
+    INVERTIBLE = "invertible"
+    MAX = "max"
+    MIN = "min"
+
+
 class AggConsistency(enum.Enum):
     DEFERRED = "deferred"
     IMMEDIATE = "immediate"
 
 
+class AggDeferredStorage(enum.Enum):
+    TEMP = "temp"
+    UNLOGGED = "unlogged"
+
+
 @dataclasses_json.dataclass_json(
     letter_case=dataclasses_json.LetterCase.CAMEL,
     undefined=dataclasses_json.Undefined.EXCLUDE,
@@ -22,13 +34,44 @@ class AggAggregate:
     value: str
     combine: typing.Optional[str] = None
     identity: str = "0"
+    kind: AggAggregateKind = AggAggregateKind.INVERTIBLE
+
+    @property
+    def extreme(self) -> bool:
+        return self.kind in (AggAggregateKind.MAX, AggAggregateKind.MIN)
+
+    def change_expression(self) -> str:
+        """
+        Aggregate of changed records
+        """
+        if self.extreme:
+            return f"{self.kind.value}({self.value}) FILTER (WHERE sign = 1)"
+        if self.kind == AggAggregateKind.DISTINCT:
+            # counted from the reference counts
+            return "0"
+        return self.value
+
+    def removed_expression(self) -> str:
+        """
+        Extreme of removed records
+        """
+        return f"{self.kind.value}({self.value}) FILTER (WHERE sign = -1)"
+
+    def identity_expression(self) -> str:
+        if self.extreme:
+            return "NULL"
+        if self.kind == AggAggregateKind.DISTINCT:
+            return "0"
+        return self.identity
 
     def combine_expression(self, name):
-        return (
-            self.combine
-            if self.combine is not None
-            else f"existing.{SqlId(name)} + excluded.{SqlId(name)}"
-        )
+        if self.combine is not None:
+            return self.combine
+        if self.kind == AggAggregateKind.MAX:
+            return f"greatest(existing.{SqlId(name)}, excluded.{SqlId(name)})"
+        if self.kind == AggAggregateKind.MIN:
+            return f"least(existing.{SqlId(name)}, excluded.{SqlId(name)})"
+        return f"existing.{SqlId(name)} + excluded.{SqlId(name)}"
 
 
 @dataclasses_json.dataclass_json(
@@ -49,6 +92,16 @@ class AggTable:
         )
 
 
+@dataclasses_json.dataclass_json(
+    letter_case=dataclasses_json.LetterCase.CAMEL,
+    undefined=dataclasses_json.Undefined.EXCLUDE,
+)
+@dataclasses.dataclass
+class AggRollup:
+    groups: typing.Dict[str, str]
+    target: AggTable
+
+
 @dataclasses_json.dataclass_json(
     letter_case=dataclasses_json.LetterCase.CAMEL,
     undefined=dataclasses_json.Undefined.EXCLUDE,
@@ -60,10 +113,14 @@ class AggConfig:
     aggregates: typing.Dict[str, AggAggregate]
     source: AggTable
     target: AggTable
+    bypass: bool = False
     consistency: AggConsistency = AggConsistency.IMMEDIATE
+    deferred_storage: AggDeferredStorage = AggDeferredStorage.TEMP
     filter: typing.Optional[str] = None
+    rollups: typing.List[AggRollup] = dataclasses.field(default_factory=list)
     shard: typing.Union[bool, typing.Dict[str, str]] = False
     schema: typing.Optional[str] = None
+    update_columns: typing.Optional[typing.List[str]] = None
 
 
 AGG_JSON_FORMAT = package_json_format("denorm.formats", "agg.json")
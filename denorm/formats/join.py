@@ -13,11 +13,22 @@ class JoinConsistency(enum.Enum):
     IMMEDIATE = "immediate"
 
 
+class JoinDeferredStorage(enum.Enum):
+    TEMP = "temp"
+    UNLOGGED = "unlogged"
+
+
 class JoinJoinMode(enum.Enum):
     ASYNC = "async"
     SYNC = "sync"
 
 
+class JoinUpdateDiff(enum.Enum):
+    COUNT = "count"
+    EXCEPT = "except"
+    KEY = "key"
+
+
 class JoinRefresh(enum.Enum):
     INSERT = "insert"
     FULL = "full"
@@ -61,6 +72,9 @@ class JoinTargetTable:
     table_key: typing.Optional[typing.List[str]] = None
     table_schema: typing.Optional[str] = None
     refresh: JoinRefresh = JoinRefresh.FULL
+    skip_unchanged: bool = False
+    rebuild_keys: typing.Optional[int] = None
+    rebuild_fraction: typing.Optional[float] = None
 
     @property
     def sql(self) -> SqlObject:
@@ -77,17 +91,22 @@ class JoinTargetTable:
 @dataclasses.dataclass
 class JoinTable:
     table_columns: typing.Optional[typing.List[JoinColumn]] = None
+    table_filter: typing.Optional[str] = None
     table_name: typing.Optional[str] = None
     join_target_table: typing.Optional[str] = None
     join_target_key: typing.Optional[typing.List[str]] = None
+    join_target_index: typing.Optional[typing.List[str]] = None
     join_on: typing.Optional[str] = None
     join_mode: JoinJoinMode = JoinJoinMode.SYNC
     join_other: typing.Optional[str] = None
     table_key: typing.Optional[typing.List[JoinKeyColumn]] = None
     refresh_function: bool = False
+    row_trigger: bool = False
     lock_id: typing.Optional[int] = None
     table_schema: typing.Optional[str] = None
     destination_key_expr: typing.Optional[typing.List[str]] = None
+    update_columns: typing.Optional[typing.List[str]] = None
+    update_diff: JoinUpdateDiff = JoinUpdateDiff.EXCEPT
 
     def __eq__(self, other):
         return self is other
@@ -131,7 +150,11 @@ class JoinHook:
 class JoinConfig:
     id: str
     tables: typing.Dict[str, JoinTable]
+    analyze_threshold: typing.Optional[int] = None
+    bypass: bool = False
     consistency: JoinConsistency = JoinConsistency.IMMEDIATE
+    deferred_chunk_size: typing.Optional[int] = None
+    deferred_storage: JoinDeferredStorage = JoinDeferredStorage.TEMP
     context: typing.List[str] = dataclasses.field(default_factory=list)
     key: typing.Optional[typing.List[JoinKeyColumn]] = None
     lock: bool = False
@@ -139,6 +162,7 @@ class JoinConfig:
     setup: typing.Optional[JoinHook] = None
     destination_query: typing.Optional[str] = "TABLE ${key}"
     destination_table: typing.Optional[JoinTargetTable] = None
+    postgres_version: typing.Optional[int] = None
 
 
 class JoinInvalid(Exception):
@@ -147,6 +171,15 @@ class JoinInvalid(Exception):
 
 
 def validate_join(join: JoinConfig):
+    target = join.destination_table
+    if target is not None and (
+        target.rebuild_keys is not None or target.rebuild_fraction is not None
+    ):
+        if target.refresh != JoinRefresh.FULL:
+            raise JoinInvalid("Destination rebuild requires full refresh")
+        if not target.table_key:
+            raise JoinInvalid("Destination rebuild requires tableKey")
+
     for table_id, table in join.tables.items():
         if table.refresh_function and any(
             column.type is None for column in table.table_key or []
@@ -154,6 +187,8 @@ def validate_join(join: JoinConfig):
             raise JoinInvalid(
                 f"Table {table_id} refreshFunction required types for columns"
             )
+        if table.update_diff == JoinUpdateDiff.KEY and not table.table_key:
+            raise JoinInvalid(f"Table {table_id} updateDiff key requires tableKey")
 
 
 JOIN_JSON_FORMAT = package_json_format("denorm.formats", "join.json")
@@ -2,10 +2,14 @@
 Procedures:
 * ID__refresh - Perform refresh
   - When consistency is deferred
-* ID__setup - Create the temporary tables
+* ID__flush - Perform refresh now
   - When consistency is deferred
+* ID__setup - Create the temporary tables
+  - When consistency is deferred, with temp storage
 * ID__chg1__SOURCE - Process changes
 * ID__chg2__SOURCE - Process changes
+* ID__row__SOURCE - Process single-row changes
+  - When rowTrigger is set
 
 Tables:
 * BASE (existing) - Table to watch
@@ -14,16 +18,28 @@ Tables:
     * ID__del__SOURCE - Record deletes
     * ID__ins__SOURCE - Record inserts
     * ID__upd__SOURCE - Record updates
+    * ID__rdel__SOURCE - Record single-row deletes
+      - When rowTrigger is set
+    * ID__rins__SOURCE - Record single-row inserts
+      - When rowTrigger is set
+    * ID__rupd__SOURCE - Record single-row updates
+      - When rowTrigger is set
 * TARGET (existing) - Table to populate
 * ID__iterate__SOURCE - Queue changes for iteration
   - When iteration is used
 * ID__lock - Value lock
+* ID__key - Keys to update, by transaction
+  - When consistency is deferred, with unlogged storage
+* ID__pending - Fire constraint trigger at end of transaction
+  - When consistency is deferred, with unlogged storage
+  - Triggers:
+      * join (deferred) - Perform refresh
 
 Temp tables:
 * ID__key - Keys to update
-  - When consistency is deferred
+  - When consistency is deferred, with temp storage
 * ID__refresh - Fire constraint trigger at end of transaction
-  - When consistency is deferred
+  - When consistency is deferred, with temp storage
   - Triggers:
       * join (deferred) - Perform refresh
 """
@@ -38,18 +54,29 @@ from .formats.join import (
     JOIN_DATA_JSON_FORMAT,
     JoinConfig,
     JoinConsistency,
+    JoinDeferredStorage,
     JoinJoinMode,
 )
 from .join_async import create_queue
-from .join_change import create_change
+from .join_bypass import create_catchup_function, create_staging_table
+from .join_change import TableChange, create_change, table_change
 from .join_common import JoinTarget, Key, Structure
-from .join_defer import DeferredKeys, create_refresh_function, create_setup_function
+from .join_defer import (
+    DeferredKeys,
+    create_flush_function,
+    create_refresh_function,
+    create_setup_function,
+    create_unlogged_tables,
+)
+from .join_index import create_indexes
 from .join_key import KeyResolver, TargetRefresh
 from .join_lock import create_lock_table
 from .join_plain_target import JoinPlainTarget
+from .join_rebuild import create_rebuild
 from .join_refresh_function import (
     create_refresh_function as create_table_refresh_function,
 )
+from .join_shared import create_shared_changes
 from .join_table_target import JoinTableTarget
 from .resource import ResourceFactory
 from .string import indent
@@ -61,22 +88,64 @@ class JoinIo:
     output: ResourceFactory[typing.TextIO]
 
 
-def create_join(io: JoinIo):
+@dataclasses.dataclass
+class JoinsIo:
+    configs: typing.List[ResourceFactory[typing.TextIO]]
+    output: ResourceFactory[typing.TextIO]
+
+
+def create_join(io: JoinIo, indexes: bool = False):
     schema = JOIN_DATA_JSON_FORMAT.load(io.config)
 
+    statements = create_indexes(schema) if indexes else _statements(schema)
+
     with io.output() as f:
-        for statement in _statements(schema):
+        for statement in statements:
             print(f"{statement};\n", file=f)
 
 
+def create_joins(io: JoinsIo, id: str, indexes: bool = False):
+    """
+    Create several joins, sharing triggers on their source tables
+    """
+    schemas = [JOIN_DATA_JSON_FORMAT.load(config) for config in io.configs]
+
+    if indexes:
+        statements = (
+            statement for schema in schemas for statement in create_indexes(schema)
+        )
+    else:
+        statements = _shared_statements(schemas, id)
+
+    with io.output() as f:
+        for statement in statements:
+            print(f"{statement};\n", file=f)
+
+
+def _shared_statements(configs: typing.List[JoinConfig], id: str):
+    changes = []
+    for config in configs:
+        yield from _statements(config, changes=changes)
+
+    # shared objects are in the schema of the first join
+    schema = configs[0].schema if configs else None
+    yield from create_shared_changes(id=id, schema=schema, changes=changes)
+
+
 def _target(config: JoinConfig) -> JoinTarget:
     if config.destination_table:
-        return JoinTableTarget(config.destination_table, config.destination_query)
+        return JoinTableTarget(
+            config.destination_table,
+            config.destination_query,
+            postgres_version=config.postgres_version,
+        )
     else:
         return JoinPlainTarget(config.destination_query)
 
 
-def _statements(config: JoinConfig):
+def _statements(
+    config: JoinConfig, changes: typing.Optional[typing.List[TableChange]] = None
+):
     structure = Structure(config.schema, config.id)
 
     target = _target(config)
@@ -96,23 +165,41 @@ def _statements(config: JoinConfig):
         setup=config.setup,
         structure=structure,
         lock=config.lock,
+        rebuild=create_rebuild(config),
         target=target,
     )
 
     if config.consistency == JoinConsistency.DEFERRED:
         yield from create_refresh_function(
+            analyze_threshold=config.analyze_threshold,
+            chunk_size=config.deferred_chunk_size,
             id=config.id,
+            key=key,
+            storage=config.deferred_storage,
             structure=structure,
             refresh=refresh_action,
         )
 
-        yield from create_setup_function(
-            structure=structure,
+        yield from create_flush_function(
             id=config.id,
-            target=config.destination_table,
-            key=key,
+            storage=config.deferred_storage,
+            structure=structure,
         )
 
+        if config.deferred_storage == JoinDeferredStorage.TEMP:
+            yield from create_setup_function(
+                structure=structure,
+                id=config.id,
+                target=config.destination_table,
+                key=key,
+            )
+        elif config.deferred_storage == JoinDeferredStorage.UNLOGGED:
+            yield from create_unlogged_tables(
+                structure=structure,
+                id=config.id,
+                key=key,
+            )
+
     for table_id, table in config.tables.items():
         if table.join_mode != JoinJoinMode.ASYNC:
             continue
@@ -136,9 +223,15 @@ def _statements(config: JoinConfig):
             tables=config.tables,
         )
 
+    catchup_resolvers = []
     for table_id, table in config.tables.items():
         if config.consistency == JoinConsistency.DEFERRED:
-            action = DeferredKeys(key=key.names, structure=structure)
+            action = DeferredKeys(
+                key=key.names,
+                postgres_version=config.postgres_version,
+                storage=config.deferred_storage,
+                structure=structure,
+            )
         elif config.consistency == JoinConsistency.IMMEDIATE:
             action = refresh_action
 
@@ -160,10 +253,40 @@ def _statements(config: JoinConfig):
             )
 
         if table.table_name is not None:
-            yield from create_change(
-                id=config.id,
-                resolver=resolver,
-                structure=structure,
-                table=table,
-                table_id=table_id,
-            )
+            if config.bypass:
+                yield from create_staging_table(
+                    id=config.id,
+                    structure=structure,
+                    table=table,
+                    table_id=table_id,
+                )
+                catchup_resolvers.append((table_id, resolver))
+
+            if changes is not None:
+                # triggers are shared
+                changes.append(
+                    table_change(
+                        analyze_threshold=config.analyze_threshold,
+                        bypass=config.bypass,
+                        id=config.id,
+                        resolver=resolver,
+                        structure=structure,
+                        table=table,
+                        table_id=table_id,
+                    )
+                )
+            else:
+                yield from create_change(
+                    analyze_threshold=config.analyze_threshold,
+                    bypass=config.bypass,
+                    id=config.id,
+                    resolver=resolver,
+                    structure=structure,
+                    table=table,
+                    table_id=table_id,
+                )
+
+    if config.bypass:
+        yield from create_catchup_function(
+            id=config.id, resolvers=catchup_resolvers, structure=structure
+        )
@@ -4,9 +4,16 @@ import typing
 from pg_sql import SqlId, SqlNumber, SqlObject, SqlString, sql_list
 
 from .formats.join import JoinTable
-from .join_common import Structure, context_column, foreign_column, local_column
+from .join_common import (
+    Structure,
+    context_column,
+    end_column,
+    foreign_column,
+    local_column,
+    wrap_column,
+)
 from .join_key import KeyResolver
-from .sql import SqlQuery, SqlTableExpr, table_fields, update_excluded
+from .sql import SqlQuery, SqlTableExpr, table_fields
 from .string import indent
 
 
@@ -37,6 +44,8 @@ def create_queue(
 
     local_columns = [local_column(column) for column in column_names]
     foreign_columns = [foreign_column(column) for column in table.join_target_key]
+    end_columns = [end_column(column) for column in table.join_target_key]
+    wrap_columns = [wrap_column(column) for column in table.join_target_key]
     context_columns = [context_column(setting) for setting in context]
 
     columns = (
@@ -48,6 +57,14 @@ def create_queue(
             f"{SqlObject(SqlId('f'), SqlId(column))} AS {foreign_column(column)}"
             for column in table.join_target_key
         ]
+        + [
+            f"{SqlObject(SqlId('f'), SqlId(column))} AS {end_column(column)}"
+            for column in table.join_target_key
+        ]
+        + [
+            f"{SqlObject(SqlId('f'), SqlId(column))} AS {wrap_column(column)}"
+            for column in table.join_target_key
+        ]
         + [f"NULL::text AS {context_column(setting)}" for setting in context]
         + ["NULL::bigint AS seq", "NULL::bigint AS lock", "NULL::bigint AS count"]
     )
@@ -84,6 +101,16 @@ COMMENT ON COLUMN {queue_table}.{local_column(column)} IS {SqlString(f"{table.sq
     for column in table.join_target_key:
         yield f"""
 COMMENT ON COLUMN {queue_table}.{foreign_column(column)} IS {SqlString(f"{foreign_table.sql} iterator: {SqlId(column)}")}
+"""
+
+    for column in table.join_target_key:
+        yield f"""
+COMMENT ON COLUMN {queue_table}.{end_column(column)} IS {SqlString(f"{foreign_table.sql} end of pass: {SqlId(column)}")}
+"""
+
+    for column in table.join_target_key:
+        yield f"""
+COMMENT ON COLUMN {queue_table}.{wrap_column(column)} IS {SqlString(f"{foreign_table.sql} end of next pass: {SqlId(column)}")}
 """
 
     yield f"""
@@ -112,6 +139,7 @@ CREATE INDEX ON {queue_table} (seq)
 SELECT
   {table_fields(item, local_columns)},
   {table_fields(SqlId("k"), [SqlId(column) for column in table.join_target_key])},
+  {table_fields(item, end_columns + wrap_columns)},
   {sql_list(new_fields)}
 INTO _new_item
 FROM {SqlObject(foreign_key_table)} AS k
@@ -126,32 +154,35 @@ ON {table.join_on}
     else:
         join = ""
 
-    key1_query = f"""
-SELECT {SqlId(dep)}.*
-FROM {foreign_table.sql} AS {SqlId(dep)}
-{join}
-ORDER BY {sql_list(SqlObject(SqlId(dep), SqlId(name)) for name in table.join_target_key)}
-LIMIT max_records
-    """.strip()
-    gather1 = resolver.sql(
-        foreign_key_table,
-        exprs=[SqlTableExpr(foreign_key_table, key1_query)],
-        last_expr=get_item,
+    dep_columns = table_fields(
+        SqlId(dep), (SqlId(column) for column in table.join_target_key)
     )
 
-    key2_query = f"""
+    def gather(start: bool, bounded: bool):
+        conditions = []
+        if not start:
+            conditions.append(
+                f"({table_fields(item, foreign_columns)}) < ({dep_columns})"
+            )
+        if bounded:
+            conditions.append(f"({dep_columns}) <= ({table_fields(item, end_columns)})")
+        if foreign_table.table_filter is not None:
+            conditions.append(f"({foreign_table.table_filter})")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        key_query = f"""
 SELECT {SqlId(dep)}.*
 FROM {foreign_table.sql} AS {SqlId(dep)}
 {join}
-WHERE ({table_fields(item, foreign_columns)}) < ({table_fields(SqlId(dep), (SqlId(column) for column in table.join_target_key))})
+{where}
 ORDER BY {sql_list(SqlObject(SqlId(dep), SqlId(name)) for name in table.join_target_key)}
 LIMIT max_records
-    """.strip()
-    gather2 = resolver.sql(
-        foreign_key_table,
-        exprs=[SqlTableExpr(foreign_key_table, key2_query)],
-        last_expr=get_item,
-    )
+        """.strip()
+        return resolver.sql(
+            foreign_key_table,
+            exprs=[SqlTableExpr(foreign_key_table, key_query)],
+            last_expr=get_item,
+        )
 
     context_vars = "\n".join(
         f"{SqlId(f'_context_{setting}')} text := current_setting({SqlString(setting)}, true);"
@@ -166,6 +197,56 @@ LIMIT max_records
         for setting in context
     )
 
+    process_item = f"""
+{set_context}
+
+IF ({table_fields(item, foreign_columns)}) IS NULL AND ({table_fields(item, end_columns)}) IS NULL THEN
+  -- if there is no iterator, start at the beginning
+{indent(gather(start=True, bounded=False), 1)}
+ELSIF ({table_fields(item, foreign_columns)}) IS NULL THEN
+  -- if there is no iterator, start at the beginning, up to the end
+{indent(gather(start=True, bounded=True), 1)}
+ELSIF ({table_fields(item, end_columns)}) IS NULL THEN
+  -- if there is an iterator, start at the iterator
+{indent(gather(start=False, bounded=False), 1)}
+ELSE
+  -- if there is an iterator, start at the iterator, up to the end
+{indent(gather(start=False, bounded=True), 1)}
+END IF;
+
+IF _new_item IS NULL AND ({table_fields(item, wrap_columns)}) IS NULL THEN
+  -- if the iterator was at the end, remove the queue item
+  DELETE FROM {queue_table} AS q
+  WHERE
+    ({table_fields(SqlId("q"), local_columns + context_columns)}, q.seq)
+      = ({table_fields(item, local_columns + context_columns)}, _item.seq);
+ELSIF _new_item IS NULL THEN
+  -- if the iterator was at the end and records before the iterator were
+  -- changed, start another pass up to the previous iterator
+  UPDATE {queue_table} AS q
+  SET
+    {sql_list(f'{column} = NULL' for column in foreign_columns)},
+    {sql_list(f'{end} = {wrap}' for end, wrap in zip(end_columns, wrap_columns))},
+    {sql_list(f'{column} = NULL' for column in wrap_columns)},
+    seq = nextval(pg_get_serial_sequence({SqlString(str(queue_table))}, 'seq'))
+  WHERE
+      ({table_fields(SqlId("q"), local_columns)}, q.seq)
+      = ({table_fields(item, local_columns)}, _item.seq);
+ELSE
+  -- update the queue item with the new iterator
+  UPDATE {queue_table} AS q
+  SET
+    {sql_list(f'{column} = (_new_item).{column}' for column in foreign_columns)},
+    count = _new_item.count,
+    seq = nextval(pg_get_serial_sequence({SqlString(str(queue_table))}, 'seq'))
+  WHERE
+      ({table_fields(SqlId("q"), local_columns)}, q.seq)
+      = ({table_fields(item, local_columns)}, _item.seq);
+END IF;
+
+{unset_context}
+    """.strip()
+
     process_function = structure.queue_process_function(table_id)
     yield f"""
 CREATE FUNCTION {process_function} (max_records bigint) RETURNS bool
@@ -187,35 +268,7 @@ LANGUAGE plpgsql AS $$
       RETURN false;
     END IF;
 
-{indent(set_context, 2)}
-
-    IF ({table_fields(item, (foreign_column(column) for column in table.join_target_key))}) IS NULL THEN
-      -- if there is no iterator, start at the beginning
-{indent(gather1, 3)}
-    ELSE
-      -- if there is an iterator, start at the iterator
-{indent(gather2, 3)}
-    END IF;
-
-    IF _new_item IS NULL THEN
-      -- if the iterator was at the end, remove the queue item
-      DELETE FROM {queue_table} AS q
-      WHERE
-        ({table_fields(SqlId("q"), local_columns + context_columns)}, q.seq)
-          = ({table_fields(item, local_columns + context_columns)}, _item.seq);
-    ELSE
-      -- update the queue item with the new iterator
-      UPDATE {queue_table} AS q
-      SET
-        {sql_list(f'{column} = (_new_item).{column}' for column in foreign_columns)},
-        count = _new_item.count,
-        seq = nextval(pg_get_serial_sequence({SqlString(str(queue_table))}, 'seq'))
-      WHERE
-          ({table_fields(SqlId("q"), local_columns)}, q.seq)
-          = ({table_fields(item, local_columns)}, _item.seq);
-    END IF;
-
-{indent(unset_context, 2)}
+{indent(process_item, 2)}
 
     -- notify listeners that the queue has been updated
     NOTIFY {SqlId(str(queue_table))};
@@ -229,6 +282,50 @@ $$
 COMMENT ON FUNCTION {process_function} IS {SqlString(f"Refresh for {queue_table}")}
     """.strip()
 
+    batch_function = structure.queue_batch_function(table_id)
+    yield f"""
+CREATE FUNCTION {batch_function} (max_items int, max_records bigint, OUT items int, OUT records bigint)
+LANGUAGE plpgsql AS $$
+  DECLARE
+    _item {queue_table};
+    _items {queue_table}[];
+    _new_item {queue_table};
+    {context_vars}
+  BEGIN
+    items := 0;
+    records := 0;
+
+    -- claim items, skipping those claimed by other batches
+    _items := ARRAY(
+      SELECT q
+      FROM {queue_table} AS q
+      ORDER BY q.seq
+      LIMIT max_items
+      FOR UPDATE OF q SKIP LOCKED
+    );
+
+    FOREACH _item IN ARRAY _items LOOP
+      -- skip items being processed by {process_function}
+      CONTINUE WHEN NOT pg_try_advisory_xact_lock({lock_base} + _item.lock);
+
+{indent(process_item, 3)}
+
+      items := items + 1;
+      records := records + coalesce(_new_item.count - _item.count, 0);
+    END LOOP;
+
+    IF 0 < items THEN
+      -- notify listeners that the queue has been updated
+      NOTIFY {SqlId(str(queue_table))};
+    END IF;
+  END;
+$$
+""".strip()
+
+    yield f"""
+COMMENT ON FUNCTION {batch_function} IS {SqlString(f"Refresh for {queue_table}, in batches")}
+    """.strip()
+
 
 def enqueue_sql(
     id: str,
@@ -264,12 +361,15 @@ FROM (
 ) AS t
         """.strip()
 
+    # if the item is being iterated, continue the pass and then start another
+    # pass up to the current iterator
     insert = f"""
-INSERT INTO {queue_table} ({sql_list(local_columns + context_columns)})
+INSERT INTO {queue_table} AS q ({sql_list(local_columns + context_columns)})
 {key_query}
 {order}
 ON CONFLICT ({sql_list(local_columns + context_columns)}) DO UPDATE
-  SET {update_excluded(foreign_column(column) for column in table.join_target_key)},
+  SET {sql_list(f"{end_column(column)} = NULL" for column in table.join_target_key)},
+    {sql_list(f"{wrap_column(column)} = q.{foreign_column(column)}" for column in table.join_target_key)},
     count = excluded.count,
     seq = excluded.seq
     """.strip()
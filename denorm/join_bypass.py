@@ -0,0 +1,61 @@
+import typing
+
+from pg_sql import SqlId, SqlObject, SqlString
+
+from .formats.join import JoinTable
+from .join_change import table_query
+from .join_common import Structure
+from .join_key import KeyResolver
+from .sql import SqlTableExpr
+from .string import indent
+
+
+def create_staging_table(
+    id: str, structure: Structure, table: JoinTable, table_id: str
+):
+    staging_table = structure.staging_table(table_id)
+
+    yield f"""
+CREATE TABLE {staging_table}
+AS {table_query(table, table.sql)}
+WITH NO DATA
+    """.strip()
+
+    yield f"""
+COMMENT ON TABLE {staging_table} IS {SqlString(f"Changes to {table.sql} made in bypass mode")}
+    """.strip()
+
+
+def create_catchup_function(
+    id: str,
+    resolvers: typing.List[typing.Tuple[str, KeyResolver]],
+    structure: Structure,
+):
+    """
+    Process the changes staged in bypass mode
+    """
+    staged = SqlId("_staged")
+
+    statements = []
+    for table_id, resolver in resolvers:
+        staging_table = structure.staging_table(table_id)
+        query = resolver.sql(
+            SqlObject(staged),
+            [SqlTableExpr(staged, f"DELETE FROM {staging_table} RETURNING *")],
+        )
+        statements.append(f"-- {table_id}\n{query}")
+    body = "\n\n".join(statements)
+
+    function = structure.catchup_function()
+    yield f"""
+CREATE FUNCTION {function} () RETURNS void
+LANGUAGE plpgsql AS $$
+  BEGIN
+{indent(body, 2)}
+  END;
+$$
+    """.strip()
+
+    yield f"""
+COMMENT ON FUNCTION {function} IS {SqlString(f"Process changes staged in bypass mode for destination {id}")}
+    """.strip()
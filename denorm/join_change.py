@@ -1,11 +1,15 @@
+import dataclasses
 import enum
+import functools
 import typing
 
-from pg_sql import SqlId, SqlObject, SqlString, sql_list
+from pg_sql import SqlId, SqlNumber, SqlObject, SqlString, sql_list
 
-from .formats.join import JoinTable
+from .formats.join import JoinTable, JoinUpdateDiff
 from .join_common import Structure
 from .join_key import KeyResolver
+from .sql import table_fields
+from .sql_expr import expression_columns
 from .string import indent
 
 
@@ -14,46 +18,197 @@ class _ChangeType(enum.Enum):
     CHANGE_2 = enum.auto()
 
 
+def table_query(
+    table: JoinTable, name: SqlObject, table_id: typing.Optional[str] = None
+) -> str:
+    """
+    Query for the watched columns. If table_id is given, rows are aliased by it
+    and filtered by tableFilter.
+    """
+    if table_id is not None and table.table_filter is not None:
+        source = f"{name} AS {SqlId(table_id)} WHERE {table.table_filter}"
+    elif table_id is not None:
+        source = f"{name} AS {SqlId(table_id)}"
+    elif table.table_columns is None:
+        return f"TABLE {name}"
+    else:
+        source = str(name)
+
+    if table.table_columns is None:
+        return f"SELECT * FROM {source}"
+    values = sql_list(
+        column.sql if column.value is None else f"{column.value} AS {column.sql}"
+        for column in table.table_columns
+    )
+    return f"SELECT {values} FROM {source}"
+
+
+@dataclasses.dataclass
+class TableChange:
+    """
+    Change handling for a source table, for one destination
+    """
+
+    id: str
+    structure: Structure
+    table: JoinTable
+    table_id: str
+    change_1_root: str
+    change_1_body: typing.Callable[[str], str]
+    change_2_root: str
+    change_2_body: typing.Callable[[str], str]
+    row: typing.Optional[str]
+    update_columns: typing.Optional[typing.List[str]]
+
+    @property
+    def change_1(self) -> str:
+        """
+        Handle inserts and deletes
+        """
+        return self.change_1_body(self.change_1_root)
+
+    @property
+    def change_2(self) -> str:
+        """
+        Handle updates
+        """
+        return self.change_2_body(self.change_2_root)
+
+
+def table_change(
+    id: str,
+    table: JoinTable,
+    table_id: str,
+    resolver: KeyResolver,
+    structure: Structure,
+    analyze_threshold: typing.Optional[int] = None,
+    bypass: bool = False,
+) -> TableChange:
+    if bypass:
+        bypass_setting = structure.bypass_setting()
+        staging_table = structure.staging_table(table_id)
+    else:
+        bypass_setting = None
+        staging_table = None
+
+    update_columns = _update_columns(table, table_id)
+    if update_columns is not None:
+        update_columns_setting = structure.update_columns_setting(table_id)
+    else:
+        update_columns_setting = None
+
+    if table.row_trigger:
+        row_setting = structure.row_setting(table_id)
+        row = _row_body(
+            bypass_setting=bypass_setting,
+            resolver=resolver,
+            row_setting=row_setting,
+            staging_table=staging_table,
+            table=table,
+            table_id=table_id,
+        )
+    else:
+        row_setting = None
+        row = None
+
+    def body(change_type: _ChangeType):
+        return functools.partial(
+            _change_body,
+            analyze_threshold=analyze_threshold,
+            bypass_setting=bypass_setting,
+            change_table=structure.change_table(table_id),
+            change_type=change_type,
+            resolver=resolver,
+            row_setting=row_setting,
+            staging_table=staging_table,
+            update_columns_setting=update_columns_setting,
+        )
+
+    return TableChange(
+        id=id,
+        structure=structure,
+        table=table,
+        table_id=table_id,
+        change_1_root=_change_root(_ChangeType.CHANGE_1, table, table_id),
+        change_1_body=body(_ChangeType.CHANGE_1),
+        change_2_root=_change_root(_ChangeType.CHANGE_2, table, table_id),
+        change_2_body=body(_ChangeType.CHANGE_2),
+        row=row,
+        update_columns=update_columns,
+    )
+
+
 def create_change(
     id: str,
     table: JoinTable,
     table_id: str,
     resolver: KeyResolver,
     structure: Structure,
+    analyze_threshold: typing.Optional[int] = None,
+    bypass: bool = False,
 ):
+    change = table_change(
+        analyze_threshold=analyze_threshold,
+        bypass=bypass,
+        id=id,
+        resolver=resolver,
+        structure=structure,
+        table=table,
+        table_id=table_id,
+    )
+
     change_1_function = structure.change_1_function(table_id)
+    yield from create_change_function(
+        body=change.change_1,
+        comment=f"Handle inserts and deletes to table {table_id} for destination {id}",
+        function=change_1_function,
+    )
+
     change_2_function = structure.change_2_function(table_id)
+    yield from create_change_function(
+        body=change.change_2,
+        comment=f"Handle updates to table {table_id} for destination {id}",
+        function=change_2_function,
+    )
 
-    for change_type in (_ChangeType.CHANGE_1, _ChangeType.CHANGE_2):
-        if change_type == _ChangeType.CHANGE_1:
-            change_function = change_1_function
-        elif change_type == _ChangeType.CHANGE_2:
-            change_function = change_2_function
+    yield from create_change_triggers(
+        change_1_function=change_1_function,
+        change_2_function=change_2_function,
+        delete_trigger=structure.delete_trigger(table_id),
+        insert_trigger=structure.insert_trigger(table_id),
+        table=table,
+        update_trigger=structure.update_trigger(table_id),
+    )
 
-        yield from _create_change_function(
-            change_type=change_type,
-            function=change_function,
-            id=id,
-            resolver=resolver,
-            table=table,
-            table_id=table_id,
+    if change.update_columns is not None:
+        yield from create_update_columns(
+            change, trigger=structure.update_columns_trigger(table_id)
         )
 
-    delete_trigger = structure.delete_trigger(table_id)
+    if change.row is not None:
+        yield from create_row_change(change)
+
+
+def create_change_triggers(
+    change_1_function: SqlObject,
+    change_2_function: SqlObject,
+    delete_trigger: SqlId,
+    insert_trigger: SqlId,
+    table: JoinTable,
+    update_trigger: SqlId,
+):
     yield f"""
 CREATE TRIGGER {delete_trigger} AFTER DELETE ON {table.sql}
 REFERENCING OLD TABLE AS _change
 FOR EACH STATEMENT EXECUTE PROCEDURE {change_1_function}()
     """.strip()
 
-    insert_trigger = structure.insert_trigger(table_id)
     yield f"""
 CREATE TRIGGER {insert_trigger} AFTER INSERT ON {table.sql}
 REFERENCING NEW TABLE AS _change
 FOR EACH STATEMENT EXECUTE PROCEDURE {change_1_function}()
     """.strip()
 
-    update_trigger = structure.update_trigger(table_id)
     yield f"""
 CREATE TRIGGER {update_trigger} AFTER UPDATE ON {table.sql}
 REFERENCING OLD TABLE AS _old NEW TABLE AS _new
@@ -61,44 +216,111 @@ FOR EACH STATEMENT EXECUTE PROCEDURE {change_2_function}()
     """.strip()
 
 
-def _create_change_function(
-    change_type: _ChangeType,
-    function: SqlObject,
-    id: str,
-    resolver: KeyResolver,
-    table_id: str,
-    table: JoinTable,
-):
-    def query(name: SqlObject):
-        if table.table_columns is None:
-            return f"TABLE {name}"
-        values = sql_list(
-            column.sql if column.value is None else f"{column.value} AS {column.sql}"
-            for column in table.table_columns
-        )
-        return f"SELECT {values} FROM {name}"
+def _update_columns(
+    table: JoinTable, table_id: str
+) -> typing.Optional[typing.List[str]]:
+    """
+    Columns whose updates can affect the destination, or None if any can
+    """
+    # updates to filtered columns move rows into or out of the filter
+    if table.table_filter is not None:
+        filter_columns = expression_columns(table.table_filter, alias=table_id)
+        if filter_columns is None:
+            return None
+    else:
+        filter_columns = []
 
-    if change_type == _ChangeType.CHANGE_1:
-        change = SqlObject("_change")
-        root = f"({query(change)})"
-        comment_str = "inserts and deletes"
-    elif change_type == _ChangeType.CHANGE_2:
-        old = SqlObject("_old")
-        new = SqlObject("_new")
-        root = f"""
-(
-    ({query(old)} EXCEPT ALL {query(new)})
-    UNION ALL
-    ({query(new)} EXCEPT ALL {query(old)})
-)
+    if table.update_columns is not None:
+        return table.update_columns + [
+            column for column in filter_columns if column not in table.update_columns
+        ]
+
+    # Without tableColumns, the destination query may read any column.
+    # With them, joinOn, destinationKeyExpr, and tableKey can only reference
+    # the selected columns.
+    if table.table_columns is None:
+        return None
+
+    columns = set(filter_columns)
+    for column in table.table_columns:
+        if column.value is None:
+            columns.add(column.name)
+            continue
+        names = expression_columns(column.value)
+        if names is None:
+            return None
+        columns.update(names)
+
+    return sorted(columns) or None
+
+
+def create_update_columns(change: TableChange, trigger: SqlId):
+    # PostgreSQL does not allow transition tables for column-specific triggers.
+    # Instead, a column-specific trigger sets a flag for the update trigger,
+    # which fires after it in name order.
+    function = change.structure.update_columns_function(change.table_id)
+    setting = change.structure.update_columns_setting(change.table_id)
+
+    yield f"""
+CREATE FUNCTION {function} () RETURNS trigger
+LANGUAGE plpgsql AS $$
+  BEGIN
+    PERFORM set_config({SqlString(setting)}, 'on', true);
+
+    RETURN NULL;
+  END;
+$$
+    """.strip()
+
+    yield f"""
+COMMENT ON FUNCTION {function} IS {SqlString(f'Flag updates to watched columns of table {change.table_id} for destination {change.id}')}
     """.strip()
-        comment_str = "updates"
 
+    yield f"""
+CREATE TRIGGER {trigger} AFTER UPDATE OF {sql_list(SqlId(column) for column in change.update_columns)} ON {change.table.sql}
+FOR EACH STATEMENT EXECUTE PROCEDURE {function}()
+    """.strip()
+
+
+def create_row_change(change: TableChange):
+    """
+    Process single-row statements with row triggers, which fire before the
+    statement triggers.
+    """
+    function = change.structure.row_function(change.table_id)
+
+    yield from create_change_function(
+        body=change.row,
+        comment=f"Handle single-row changes to table {change.table_id} for destination {change.id}",
+        function=function,
+    )
+
+    yield f"""
+CREATE TRIGGER {change.structure.row_delete_trigger(change.table_id)} AFTER DELETE ON {change.table.sql}
+FOR EACH ROW EXECUTE PROCEDURE {function}()
+    """.strip()
+
+    yield f"""
+CREATE TRIGGER {change.structure.row_insert_trigger(change.table_id)} AFTER INSERT ON {change.table.sql}
+FOR EACH ROW EXECUTE PROCEDURE {function}()
+    """.strip()
+
+    if change.update_columns is not None:
+        columns = f" OF {sql_list(SqlId(column) for column in change.update_columns)}"
+    else:
+        columns = ""
+    yield f"""
+CREATE TRIGGER {change.structure.row_update_trigger(change.table_id)} AFTER UPDATE{columns} ON {change.table.sql}
+FOR EACH ROW EXECUTE PROCEDURE {function}()
+    """.strip()
+
+
+def create_change_function(body: str, comment: str, function: SqlObject):
     yield f"""
 CREATE FUNCTION {function} () RETURNS trigger
 LANGUAGE plpgsql AS $$
   BEGIN
-{indent(resolver.sql(root), 2)}
+{indent(body, 2)}
 
     RETURN NULL;
   END;
@@ -106,5 +328,215 @@ $$
     """.strip()
 
     yield f"""
-COMMENT ON FUNCTION {function} IS {SqlString(f'Handle {comment_str} to table {table_id} for destination {id}')}
+COMMENT ON FUNCTION {function} IS {SqlString(comment)}
+    """.strip()
+
+
+def _change_root(change_type: _ChangeType, table: JoinTable, table_id: str) -> str:
+    """
+    Query for the changed rows of the transition tables
+    """
+
+    # filter each side of an update, so rows moving into or out of the filter
+    # are changes
+    def query(name: SqlObject):
+        return table_query(table, name, table_id)
+
+    if change_type == _ChangeType.CHANGE_1:
+        root = f"({query(SqlObject('_change'))})"
+    elif change_type == _ChangeType.CHANGE_2:
+        old = SqlObject("_old")
+        new = SqlObject("_new")
+        if table.update_diff == JoinUpdateDiff.COUNT:
+            # scan each once, keeping rows whose counts differ
+            root = f"""
+(
+    SELECT (d._row).*
+    FROM
+        (
+            SELECT -1 AS _sign, q AS _row FROM ({query(old)}) AS q
+            UNION ALL
+            SELECT 1, q FROM ({query(new)}) AS q
+        ) AS d
+    GROUP BY d._row
+    HAVING sum(d._sign) <> 0
+)
+        """.strip()
+        elif table.update_diff == JoinUpdateDiff.EXCEPT:
+            root = f"""
+(
+    ({query(old)} EXCEPT ALL {query(new)})
+    UNION ALL
+    ({query(new)} EXCEPT ALL {query(old)})
+)
+        """.strip()
+        elif table.update_diff == JoinUpdateDiff.KEY:
+            # scan each once, keeping both versions of rows that differ
+            key = [column.sql for column in table.table_key]
+            root = f"""
+(
+    SELECT (d._row).*
+    FROM
+        ({query(old)}) AS o
+        FULL JOIN ({query(new)}) AS n ON ({table_fields(SqlId("o"), key)}) = ({table_fields(SqlId("n"), key)})
+        CROSS JOIN LATERAL (SELECT o AS _row UNION ALL SELECT n) AS d
+    WHERE o IS DISTINCT FROM n AND d._row IS DISTINCT FROM NULL
+)
+        """.strip()
+
+    return root
+
+
+def _change_body(
+    root: str,
+    change_type: _ChangeType,
+    resolver: KeyResolver,
+    analyze_threshold: typing.Optional[int] = None,
+    bypass_setting: typing.Optional[str] = None,
+    change_table: typing.Optional[SqlObject] = None,
+    row_setting: typing.Optional[str] = None,
+    staging_table: typing.Optional[SqlObject] = None,
+    update_columns_setting: typing.Optional[str] = None,
+) -> str:
+    if change_type == _ChangeType.CHANGE_1:
+        count_table = SqlObject("_change")
+    elif change_type == _ChangeType.CHANGE_2:
+        count_table = SqlObject("_new")
+
+    # avoids early returns, so bodies can be combined
+    if analyze_threshold is not None:
+        analyze = _Analyze(
+            change_table=change_table,
+            count_table=count_table,
+            threshold=analyze_threshold,
+        )
+    else:
+        analyze = None
+    body = _resolve(
+        analyze=analyze,
+        bypass_setting=bypass_setting,
+        resolver=resolver,
+        root=root,
+        staging_table=staging_table,
+    )
+    if row_setting is not None:
+        body = f"""
+-- skip single rows, which were handled by the row trigger
+IF current_setting({_row_setting_expr(row_setting)}, true) = 'statement' THEN
+{indent(body, 1)}
+END IF;
+        """.strip()
+    if change_type == _ChangeType.CHANGE_2 and update_columns_setting is not None:
+        setting = SqlString(update_columns_setting)
+        body = f"""
+-- skip updates to unwatched columns
+IF current_setting({setting}, true) = 'on' THEN
+  PERFORM set_config({setting}, '', true);
+
+{indent(body, 1)}
+END IF;
+        """.strip()
+
+    if row_setting is not None:
+        body += f"""
+
+PERFORM set_config({_row_setting_expr(row_setting)}, '', true);
+        """.rstrip()
+
+    return body
+
+
+class _Analyze(typing.NamedTuple):
+    change_table: SqlObject
+    count_table: SqlObject
+    threshold: int
+
+
+def _resolve(
+    resolver: KeyResolver,
+    root: str,
+    bypass_setting: typing.Optional[str],
+    staging_table: typing.Optional[SqlObject],
+    analyze: typing.Optional[_Analyze] = None,
+) -> str:
+    body = resolver.sql(root)
+    if analyze is not None:
+        # Transition tables have no statistics, so large changes are copied
+        # to an analyzed temp table. Small changes are not worth it.
+        threshold = SqlNumber(analyze.threshold)
+        body = f"""
+IF {threshold} <= (SELECT count(*) FROM (SELECT FROM {analyze.count_table} LIMIT {threshold}) AS c) THEN
+  IF to_regclass({SqlString(str(analyze.change_table))}) IS NULL THEN
+    CREATE TEMP TABLE {analyze.change_table}
+    ON COMMIT DELETE ROWS
+    AS SELECT * FROM {root} AS _change
+    WITH NO DATA;
+  END IF;
+
+  INSERT INTO {analyze.change_table}
+  SELECT * FROM {root} AS _change;
+
+  ANALYZE {analyze.change_table};
+
+{indent(resolver.sql(analyze.change_table), 1)}
+
+  TRUNCATE {analyze.change_table};
+ELSE
+{indent(body, 1)}
+END IF;
+        """.strip()
+    if bypass_setting is not None:
+        body = f"""
+IF current_setting({SqlString(bypass_setting)}, true) = 'on' THEN
+  -- stage changes for catchup
+  INSERT INTO {staging_table}
+  SELECT * FROM {root} AS _change;
+ELSE
+{indent(body, 1)}
+END IF;
+        """.strip()
+    return body
+
+
+def _row_setting_expr(row_setting: str) -> str:
+    # statements may insert, update, and delete, e.g. MERGE
+    return f"{SqlString(f'{row_setting}__')} || lower(TG_OP)"
+
+
+def _row_body(
+    resolver: KeyResolver,
+    row_setting: str,
+    table: JoinTable,
+    table_id: str,
+    bypass_setting: typing.Optional[str] = None,
+    staging_table: typing.Optional[SqlObject] = None,
+) -> str:
+    def query(row: str):
+        return table_query(table, f"(SELECT ({row}).*)", table_id)
+
+    def resolve(root: str):
+        return _resolve(
+            bypass_setting=bypass_setting,
+            resolver=resolver,
+            root=root,
+            staging_table=staging_table,
+        )
+
+    setting = _row_setting_expr(row_setting)
+    # The first row is processed immediately. If there are more, the statement
+    # trigger processes all of them; processing a key twice is harmless.
+    return f"""
+IF coalesce(current_setting({setting}, true), '') = '' THEN
+  PERFORM set_config({setting}, 'row', true);
+
+  IF TG_OP = 'DELETE' THEN
+{indent(resolve(f"({query('OLD')})"), 2)}
+  ELSIF TG_OP = 'INSERT' THEN
+{indent(resolve(f"({query('NEW')})"), 2)}
+  ELSE
+{indent(resolve(f"(({query('OLD')} EXCEPT ALL {query('NEW')}) UNION ALL ({query('NEW')} EXCEPT ALL {query('OLD')}))"), 2)}
+  END IF;
+ELSE
+  PERFORM set_config({setting}, 'statement', true);
+END IF;
     """.strip()
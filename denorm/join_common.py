@@ -42,21 +42,75 @@ class Structure:
     def update_trigger(self, table_id: str) -> SqlId:
         return self._name(f"upd__{table_id}")
 
+    def update_columns_function(self, table_id: str) -> SqlObject:
+        return self._sql_object(self._name(f"upc__{table_id}"))
+
+    def update_columns_setting(self, table_id: str) -> str:
+        return f"denorm.{self._id}__upc__{table_id}"
+
+    def update_columns_trigger(self, table_id: str) -> SqlId:
+        return self._name(f"upc__{table_id}")
+
+    def row_function(self, table_id: str) -> SqlObject:
+        return self._sql_object(self._name(f"row__{table_id}"))
+
+    def row_setting(self, table_id: str) -> str:
+        return f"denorm.{self._id}__row__{table_id}"
+
+    def row_delete_trigger(self, table_id: str) -> SqlId:
+        return self._name(f"rdel__{table_id}")
+
+    def row_insert_trigger(self, table_id: str) -> SqlId:
+        return self._name(f"rins__{table_id}")
+
+    def row_update_trigger(self, table_id: str) -> SqlId:
+        return self._name(f"rupd__{table_id}")
+
+    def projection_type(self, table_id: str) -> SqlObject:
+        return self._sql_object(self._name(f"prj__{table_id}"))
+
+    def change_table(self, table_id: str) -> SqlObject:
+        return SqlObject(SqlId("pg_temp"), self._name(f"chg__{table_id}"))
+
     def lock_table(self) -> SqlObject:
         return self._sql_object(self._name("lock"))
 
+    def bypass_setting(self) -> str:
+        return f"denorm.{self._id}__bypass"
+
+    def catchup_function(self) -> SqlObject:
+        return self._sql_object(self._name("catchup"))
+
+    def staging_table(self, table_id: str) -> SqlObject:
+        return self._sql_object(self._name(f"stg__{table_id}"))
+
     def queue_table(self, table_id: str) -> SqlObject:
         return self._sql_object(self._name(f"que__{table_id}"))
 
     def queue_process_function(self, table_id: str) -> SqlObject:
         return self._sql_object(self._name(f"pcs__{table_id}"))
 
+    def queue_batch_function(self, table_id: str) -> SqlObject:
+        return self._sql_object(self._name(f"pcb__{table_id}"))
+
     def key_table(self) -> SqlObject:
         return SqlObject(SqlId("pg_temp"), self._name("key"))
 
+    def unlogged_key_table(self) -> SqlObject:
+        return self._sql_object(self._name("key"))
+
+    def unlogged_refresh_table(self) -> SqlObject:
+        return self._sql_object(self._name("pending"))
+
     def refresh_constraint(self) -> SqlId:
         return SqlId(self._id)
 
+    def flush_function(self) -> SqlObject:
+        return self._sql_object(self._name("flush"))
+
+    def unlogged_refresh_constraint(self) -> SqlObject:
+        return self._sql_object(self.refresh_constraint())
+
     def refresh_function(self) -> SqlObject:
         return self._sql_object(self._name("refresh"))
 
@@ -82,9 +136,22 @@ def foreign_column(column: str) -> str:
     return SqlId(f"foreign_{column}")
 
 
+def end_column(column: str) -> str:
+    return SqlId(f"end_{column}")
+
+
+def wrap_column(column: str) -> str:
+    return SqlId(f"wrap_{column}")
+
+
 class JoinTarget(typing.Protocol):
     def key(self) -> typing.Optional[Key]:
         pass
 
-    def sql(self, key_table: SqlObject, table_id: typing.Optional[str]) -> SqlQuery:
+    def sql(
+        self,
+        key_table: SqlObject,
+        table_id: typing.Optional[str],
+        in_cte: bool = False,
+    ) -> SqlQuery:
         pass
@@ -3,36 +3,113 @@ import typing
 from pg_sql import SqlId, SqlNumber, SqlObject, SqlString, sql_list
 
 from .format import format
+from .formats.join import JoinDeferredStorage
 from .join_common import JoinTarget, Key, Structure
 from .join_key import KeyConsumer, TargetRefresh
 from .sql import SqlTableExpr
-from .sql_query import sync_query, upsert_query
+from .sql_query import merge_insert_query, sync_query, upsert_query, use_merge
 from .string import indent
 
 
 def create_refresh_function(
     id: str,
+    key: Key,
     structure: Structure,
     refresh: TargetRefresh,
+    analyze_threshold: typing.Optional[int] = None,
+    chunk_size: typing.Optional[int] = None,
+    storage: JoinDeferredStorage = JoinDeferredStorage.TEMP,
 ):
     refresh_function = structure.refresh_function()
-    refresh_table = structure.refresh_table()
+    key_columns = sql_list(SqlId(name) for name in key.names)
 
-    key_table = structure.key_table()
-    refresh_sql = refresh.sql(f"TABLE {key_table}", None)
+    if storage == JoinDeferredStorage.TEMP:
+        key_table = structure.key_table()
+        refresh_table = structure.refresh_table()
+        key_query = f"TABLE {key_table}"
+        key_where = ""
+        clear = f"""
+-- clear refresh
+DELETE FROM {refresh_table};
+        """.strip()
+    elif storage == JoinDeferredStorage.UNLOGGED:
+        key_table = structure.unlogged_key_table()
+        refresh_table = structure.unlogged_refresh_table()
+        key_where = "WHERE txid = txid_current()"
+        key_query = f"SELECT {key_columns} FROM {key_table} {key_where}"
+        clear = f"""
+-- clear keys and refresh
+DELETE FROM {key_table}
+WHERE txid = txid_current();
+
+DELETE FROM {refresh_table}
+WHERE txid = txid_current();
+        """.strip()
+
+    if chunk_size is not None:
+        # Each statement refreshes the next keys in order, bounding the size
+        # of its results. Processed keys are removed.
+        chunk = SqlId("_chunk")
+        chunk_query = f"""
+DELETE FROM {key_table}
+WHERE ctid IN (
+  SELECT ctid
+  FROM {key_table}
+  {key_where}
+  ORDER BY {key_columns}
+  LIMIT {SqlNumber(chunk_size)}
+)
+RETURNING {key_columns}
+        """.strip()
+        refresh_sql = f"""
+-- refresh in chunks
+LOOP
+  EXIT WHEN NOT EXISTS ({key_query});
+
+{indent(str(refresh.sql(f"TABLE {chunk}", None, exprs=[SqlTableExpr(chunk, chunk_query)], rebuild=False)), 1)}
+END LOOP;
+        """.strip()
+
+        rebuild_condition = refresh.rebuild_condition(key_query)
+        if rebuild_condition is not None:
+            # Decide once for all keys, since each chunk is below the threshold
+            # or else each would rebuild.
+            refresh_sql = f"""
+IF {rebuild_condition} THEN
+  -- rebuild
+{indent(refresh.sql(key_query, None), 1)}
+
+  DELETE FROM {key_table} {key_where};
+ELSE
+{indent(refresh_sql, 1)}
+END IF;
+            """.strip()
+    else:
+        refresh_sql = f"""
+-- refresh
+{refresh.sql(key_query, None)}
+        """.strip()
+
+    if analyze_threshold is not None:
+        # small batches are not worth analyzing
+        analyze = f"""
+-- analyze large batches
+IF {SqlNumber(analyze_threshold)} <= (SELECT count(*) FROM ({key_query} LIMIT {SqlNumber(analyze_threshold)}) AS k) THEN
+  ANALYZE {key_table};
+END IF;
+        """.strip()
+    else:
+        analyze = ""
 
     yield f"""
 CREATE FUNCTION {refresh_function} () RETURNS trigger
 LANGUAGE plpgsql AS $$
   BEGIN
-    -- analyze
-    ANALYZE {refresh_table};
+{indent(analyze, 2)}
 
-    -- refresh
-{indent(str(refresh_sql), 2)}
+{indent(refresh_sql, 2)}
 
-    -- clear refresh
-    DELETE FROM {refresh_table};
+{indent(clear, 2)}
 
     RETURN NULL;
   END;
@@ -44,6 +121,45 @@ COMMENT ON FUNCTION {refresh_function} IS {SqlString(f'Refresh {id}')}
     """.strip()
 
 
+def create_flush_function(
+    id: str,
+    structure: Structure,
+    storage: JoinDeferredStorage = JoinDeferredStorage.TEMP,
+):
+    """
+    Apply deferred changes immediately, by firing the pending refresh
+    """
+    flush_function = structure.flush_function()
+
+    if storage == JoinDeferredStorage.TEMP:
+        constraint = SqlObject(SqlId("pg_temp"), structure.refresh_constraint())
+        # without the temp tables, there is nothing to flush
+        check = f"""
+IF to_regclass({SqlString(str(structure.refresh_table()))}) IS NULL THEN
+  RETURN;
+END IF;
+        """.strip()
+    elif storage == JoinDeferredStorage.UNLOGGED:
+        constraint = structure.unlogged_refresh_constraint()
+        check = ""
+
+    yield f"""
+CREATE FUNCTION {flush_function} () RETURNS void
+LANGUAGE plpgsql AS $$
+  BEGIN
+{indent(check, 2)}
+
+    SET CONSTRAINTS {constraint} IMMEDIATE;
+    SET CONSTRAINTS {constraint} DEFERRED;
+  END;
+$$
+    """.strip()
+
+    yield f"""
+COMMENT ON FUNCTION {flush_function} IS {SqlString(f"Apply deferred changes for {id}")}
+    """.strip()
+
+
 def create_setup_function(
     structure: Structure,
     id: str,
@@ -87,9 +203,66 @@ COMMENT ON FUNCTION {setup_function} IS {SqlString(f"Set up temp tables for {id}
     """.strip()
 
 
+def create_unlogged_tables(
+    structure: Structure,
+    id: str,
+    key: Key,
+):
+    """
+    Create tables shared by all sessions, as an alternative to the setup
+    function. Rows are identified by transaction.
+    """
+    key_table = structure.unlogged_key_table()
+    refresh_constraint = structure.refresh_constraint()
+    refresh_function = structure.refresh_function()
+    refresh_table = structure.unlogged_refresh_table()
+
+    yield f"""
+CREATE UNLOGGED TABLE {key_table}
+AS SELECT NULL::bigint AS txid, *
+FROM ({key.definition}) AS k
+WITH NO DATA
+    """.strip()
+
+    yield f"""
+ALTER TABLE {key_table}
+  ALTER txid SET DEFAULT txid_current(),
+  ALTER txid SET NOT NULL,
+  ADD PRIMARY KEY (txid, {sql_list([SqlId(name) for name in key.names])})
+    """.strip()
+
+    yield f"""
+COMMENT ON TABLE {key_table} IS {SqlString(f"Keys to refresh at the end of each transaction for {id}")}
+    """.strip()
+
+    yield f"""
+CREATE UNLOGGED TABLE {refresh_table} (
+  txid bigint DEFAULT txid_current() PRIMARY KEY
+)
+    """.strip()
+
+    yield f"""
+COMMENT ON TABLE {refresh_table} IS {SqlString(f"Transactions to refresh for {id}")}
+    """.strip()
+
+    yield f"""
+CREATE CONSTRAINT TRIGGER {refresh_constraint} AFTER INSERT ON {refresh_table}
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE PROCEDURE {refresh_function}()
+    """.strip()
+
+
 class DeferredKeys(KeyConsumer):
-    def __init__(self, key: typing.List[str], structure: Structure):
+    def __init__(
+        self,
+        key: typing.List[str],
+        structure: Structure,
+        postgres_version: typing.Optional[int] = None,
+        storage: JoinDeferredStorage = JoinDeferredStorage.TEMP,
+    ):
         self._key = key
+        self._postgres_version = postgres_version
+        self._storage = storage
         self._structure = structure
 
     def sql(
@@ -99,27 +272,45 @@ class DeferredKeys(KeyConsumer):
         exprs: typing.List[SqlTableExpr] = [],
         last_expr: typing.Optional[str] = None,
     ):
-        setup_function = self._structure.setup_function()
-
-        refresh_table = self._structure.refresh_table()
+        if self._storage == JoinDeferredStorage.TEMP:
+            columns = self._key
+            key_table = self._structure.key_table()
+            refresh_table = self._structure.refresh_table()
+            setup = f"PERFORM {self._structure.setup_function()}();"
+            pending = f"TABLE {refresh_table}"
+        elif self._storage == JoinDeferredStorage.UNLOGGED:
+            columns = ["txid"] + self._key
+            key_query = f"SELECT txid_current(), k.* FROM ({key_query}) AS k"
+            key_table = self._structure.unlogged_key_table()
+            refresh_table = self._structure.unlogged_refresh_table()
+            setup = ""
+            pending = f"SELECT FROM {refresh_table} WHERE txid = txid_current()"
 
-        query = upsert_query(
-            columns=self._key,
-            key=self._key,
-            query=key_query,
-            target=self._structure.key_table(),
-        )
+        if use_merge(self._postgres_version, last_expr is not None):
+            query = merge_insert_query(
+                columns=columns,
+                key=columns,
+                query=key_query,
+                target=key_table,
+            )
+        else:
+            query = upsert_query(
+                columns=columns,
+                key=columns,
+                query=key_query,
+                target=key_table,
+            )
         for expr in reversed(exprs):
             query.prepend(expr)
         if last_expr is not None:
             query.append(SqlId("_other"), last_expr)
 
         return f"""
-PERFORM {setup_function}();
+{setup}
 
 {query};
 
 INSERT INTO {refresh_table}
 SELECT
-WHERE NOT EXISTS (TABLE {refresh_table});
+WHERE NOT EXISTS ({pending});
         """.strip()
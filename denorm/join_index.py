@@ -0,0 +1,48 @@
+import typing
+
+from .formats.join import JoinConfig, JoinJoinMode
+from .sql import create_index
+from .sql_expr import expression_columns
+
+
+def create_indexes(config: JoinConfig):
+    """
+    Create indexes for the joins to each dependency table
+    """
+    created: typing.Set[typing.Tuple[str, ...]] = set()
+
+    for table_id, table in config.tables.items():
+        if table.join_target_table is None:
+            continue
+        target = config.tables[table.join_target_table]
+        if target.table_name is None:
+            continue
+
+        if table.join_target_index is not None:
+            columns = list(table.join_target_index)
+        elif table.join_on is not None:
+            columns = (
+                expression_columns(
+                    table.join_on,
+                    alias=table.join_target_table,
+                    other_aliases=[table_id],
+                )
+                or []
+            )
+        else:
+            columns = []
+        if not columns:
+            continue
+
+        if table.join_mode == JoinJoinMode.ASYNC:
+            # iterate in key order
+            columns += [
+                column for column in table.join_target_key if column not in columns
+            ]
+
+        index = (str(target.sql), *columns)
+        if index in created:
+            continue
+        created.add(index)
+
+        yield create_index(target.sql, target.table_name, columns)
@@ -14,6 +14,7 @@ from .formats.join import (
 from .graph import closure
 from .join_common import JoinTarget, Structure, foreign_column, local_column
 from .join_lock import lock_sql
+from .join_rebuild import Rebuild
 from .sql import SqlQuery, SqlTableExpr, table_fields, update_excluded
 from .sql_query import sync_query, upsert_query
 from .string import indent
@@ -37,9 +38,11 @@ class TargetRefresh(KeyConsumer):
         key: typing.List[str],
         structure: Structure,
         target: JoinTarget,
+        rebuild: typing.Optional[Rebuild] = None,
     ):
         self._key = key
         self._lock = lock
+        self._rebuild = rebuild
         self._setup = setup
         self._structure = structure
         self._target = target
@@ -50,6 +53,7 @@ class TargetRefresh(KeyConsumer):
         table_id: str,
         exprs: typing.List[SqlTableExpr] = [],
         last_expr: typing.Optional[str] = None,
+        rebuild: bool = True,
     ):
         if self._setup is None:
             setup_sql = ""
@@ -68,7 +72,9 @@ ANALYZE {lock_table};
 {target_query};
             """.strip()
 
-            target_query = self._target.sql(lock_table, table_id)
+            target_query = self._target.sql(
+                lock_table, table_id, in_cte=last_expr is not None
+            )
             for expr in reversed(exprs):
                 target_query.prepend(expr)
             if last_expr is not None:
@@ -81,8 +87,15 @@ ANALYZE {lock_table};
             """.strip()
         else:
             key_table = SqlId("_key")
-            target_query = self._target.sql(key_table, table_id)
-            target_query.prepend(SqlTableExpr(key_table, key_query))
+            target_query = self._target.sql(
+                key_table, table_id, in_cte=last_expr is not None
+            )
+            if rebuild and self._rebuild is not None and last_expr is None:
+                key_exprs = self._rebuild.key_exprs(key_table, key_query)
+            else:
+                key_exprs = [SqlTableExpr(key_table, key_query)]
+            for expr in reversed(key_exprs):
+                target_query.prepend(expr)
             for expr in reversed(exprs):
                 target_query.prepend(expr)
             if last_expr is not None:
@@ -93,6 +106,14 @@ ANALYZE {lock_table};
 {target_query};
             """.strip()
 
+    def rebuild_condition(self, key_query: str) -> typing.Optional[str]:
+        """
+        Condition that the keys exceed the rebuild threshold, if any
+        """
+        if self._rebuild is None:
+            return None
+        return self._rebuild.exceeded(key_query)
+
 
 class KeyResolver:
     def __init__(
@@ -134,7 +155,12 @@ class KeyResolver:
     ) -> str:
         key_query = ""
         for i, (dep_id, dep) in enumerate(reversed(self._deps)):
-            table_sql = root if i == len(self._deps) - 1 else str(dep.sql)
+            if i == len(self._deps) - 1:
+                table_sql = root
+            elif dep.table_filter is not None:
+                table_sql = f"(SELECT * FROM {dep.sql} AS {SqlId(dep_id)} WHERE {dep.table_filter})"
+            else:
+                table_sql = str(dep.sql)
 
             if dep.destination_key_expr is not None:
                 key_query += f"SELECT DISTINCT {sql_list(f'{k} AS {SqlId(t)}' for t, k in zip(self._key, dep.destination_key_expr))}"
@@ -18,7 +18,12 @@ class JoinPlainTarget(JoinTarget):
     def key(self) -> typing.Optional[Key]:
         pass
 
-    def sql(self, key_table: SqlObject, table_id: typing.Optional[str]) -> SqlQuery:
+    def sql(
+        self,
+        key_table: SqlObject,
+        table_id: typing.Optional[str],
+        in_cte: bool = False,
+    ) -> SqlQuery:
         formatted = format(
             self._query, {"key": str(key_table), "table": table_id or ""}
         )
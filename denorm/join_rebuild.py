@@ -0,0 +1,92 @@
+import dataclasses
+import typing
+
+from pg_sql import SqlId, SqlNumber, SqlString, sql_list
+
+from .formats.join import JoinConfig, JoinRefresh
+from .sql import SqlTableExpr
+from .string import indent
+
+
+@dataclasses.dataclass
+class Rebuild:
+    """
+    Refresh all keys when a change affects more than the threshold
+    """
+
+    key_query: str
+    threshold: str
+
+    def exceeded(self, key_query: str) -> str:
+        """
+        Condition that the keys exceed the threshold
+        """
+        # stop counting after the threshold
+        return f"""
+coalesce(
+  ({self.threshold}) < (SELECT count(*) FROM ({key_query} LIMIT ({self.threshold}) + 1) AS k),
+  false
+)
+        """.strip()
+
+    def key_exprs(self, key_table: SqlId, key_query: str) -> typing.List[SqlTableExpr]:
+        change_key = SqlId("_change_key")
+        rebuild = SqlId("_rebuild")
+        threshold = SqlId("_threshold")
+
+        # stop counting after the threshold
+        rebuild_query = f"""
+SELECT coalesce((TABLE {threshold}) < count(*), false) AS rebuild
+FROM (SELECT FROM {change_key} LIMIT (TABLE {threshold}) + 1) AS k
+        """.strip()
+
+        query = f"""
+SELECT *
+FROM {change_key}
+WHERE NOT (SELECT rebuild FROM {rebuild})
+UNION ALL
+SELECT *
+FROM (
+{indent(self.key_query, 1)}
+) AS k
+WHERE (SELECT rebuild FROM {rebuild})
+        """.strip()
+
+        return [
+            SqlTableExpr(change_key, key_query),
+            SqlTableExpr(threshold, f"SELECT {self.threshold}"),
+            SqlTableExpr(rebuild, rebuild_query),
+            SqlTableExpr(key_table, query),
+        ]
+
+
+def create_rebuild(config: JoinConfig) -> typing.Optional[Rebuild]:
+    target = config.destination_table
+    if target is None or target.refresh != JoinRefresh.FULL:
+        return None
+    if target.rebuild_keys is None and target.rebuild_fraction is None:
+        return None
+
+    thresholds = []
+    if target.rebuild_keys is not None:
+        thresholds.append(str(SqlNumber(target.rebuild_keys)))
+    if target.rebuild_fraction is not None:
+        # estimated rows, or NULL if unknown
+        thresholds.append(
+            f"(SELECT {SqlNumber(target.rebuild_fraction)} * nullif(greatest(c.reltuples, 0), 0) FROM pg_class AS c WHERE c.oid = {SqlString(str(target.sql))}::regclass)::bigint"
+        )
+    threshold = (
+        thresholds[0] if len(thresholds) == 1 else f"least({sql_list(thresholds)})"
+    )
+
+    # all keys, from the source tables and the destination
+    queries = [
+        f"SELECT {sql_list(f'{expr} AS {SqlId(column)}' for column, expr in zip(target.table_key, table.destination_key_expr))} FROM {table.sql} AS {SqlId(table_id)}"
+        for table_id, table in config.tables.items()
+        if table.destination_key_expr is not None and table.table_name is not None
+    ]
+    queries.append(
+        f"SELECT {sql_list(SqlId(column) for column in target.table_key)} FROM {target.sql}"
+    )
+
+    return Rebuild(key_query="\nUNION\n".join(queries), threshold=threshold)
@@ -0,0 +1,170 @@
+"""
+Shared triggers, for multiple joins with the same source tables
+
+TABLE is the table name, prefixed by its schema if it has one.
+
+Procedures:
+* ID__chg1__TABLE - Process inserts and deletes for each join
+* ID__chg2__TABLE - Process updates for each join
+
+Views:
+* ID__prj__TABLE__N - Row type of changes projected for several joins
+
+Tables:
+* TABLE (existing) - Table to watch
+  - Triggers
+    * ID__del__TABLE - Record deletes
+    * ID__ins__TABLE - Record inserts
+    * ID__upc__TABLE__JOIN - Flag updates of watched columns
+    * ID__upd__TABLE - Record updates
+    * JOIN__rdel__TABLE, JOIN__rins__TABLE, JOIN__rupd__TABLE - Record single
+      rows, when rowTrigger is set
+"""
+
+import typing
+
+from pg_sql import SqlId, SqlObject, SqlString
+
+from .join_change import (
+    TableChange,
+    create_change_function,
+    create_change_triggers,
+    create_row_change,
+    create_update_columns,
+    table_query,
+)
+from .join_common import Structure
+from .string import indent
+
+
+def create_shared_changes(
+    id: str, changes: typing.List[TableChange], schema: typing.Optional[str] = None
+):
+    structure = Structure(schema, id)
+
+    by_table: typing.Dict[str, typing.List[TableChange]] = {}
+    for change in changes:
+        by_table.setdefault(str(change.table.sql), []).append(change)
+
+    for table_sql, table_changes in by_table.items():
+        table = table_changes[0].table
+        table_id = (
+            f"{table.table_schema}__{table.table_name}"
+            if table.table_schema is not None
+            else table.table_name
+        )
+        ids = ", ".join(change.id for change in table_changes)
+
+        # Joins that watch the same columns project the changes once, and
+        # read them from an array. The row type is defined by a view.
+        roots = [change.change_1_root for change in table_changes] + [
+            change.change_2_root for change in table_changes
+        ]
+
+        def shared(root: str) -> bool:
+            return 1 < roots.count(root)
+
+        projections: typing.Dict[str, SqlObject] = {}
+        for change in table_changes:
+            if shared(change.change_1_root) or shared(change.change_2_root):
+                projection = _projection(change)
+                if projection not in projections:
+                    projections[projection] = structure.projection_type(
+                        f"{table_id}__{len(projections) + 1}"
+                    )
+
+        for projection, projection_type in projections.items():
+            yield f"""
+CREATE VIEW {projection_type} AS
+{projection}
+            """.strip()
+
+            yield f"""
+COMMENT ON VIEW {projection_type} IS {SqlString(f"Row type of changes to {table_sql}")}
+            """.strip()
+
+        def shared_body(
+            root: typing.Callable[[TableChange], str],
+            body: typing.Callable[[TableChange], typing.Callable[[str], str]],
+        ) -> str:
+            variables: typing.Dict[str, typing.Tuple[SqlId, SqlObject]] = {}
+            bodies = []
+            for change in table_changes:
+                change_root = root(change)
+                if not shared(change_root):
+                    bodies.append((change, body(change)(change_root)))
+                    continue
+                if change_root not in variables:
+                    variables[change_root] = (
+                        SqlId(f"_change_{len(variables) + 1}"),
+                        projections[_projection(change)],
+                    )
+                variable, _ = variables[change_root]
+                bodies.append(
+                    (change, body(change)(f"(SELECT * FROM unnest({variable}))"))
+                )
+
+            result = "\n\n".join(
+                f"-- {change.id}: {change.table_id}\n{change_body}"
+                for change, change_body in bodies
+            )
+            if not variables:
+                return result
+
+            declarations = "\n".join(
+                f"{variable} {projection_type}[] := ARRAY(SELECT _change::{projection_type} FROM {root} AS _change);"
+                for root, (variable, projection_type) in variables.items()
+            )
+            return f"""
+DECLARE
+{indent(declarations, 1)}
+BEGIN
+{indent(result, 1)}
+END;
+            """.strip()
+
+        change_1_function = structure.change_1_function(table_id)
+        yield from create_change_function(
+            body=shared_body(
+                lambda change: change.change_1_root,
+                lambda change: change.change_1_body,
+            ),
+            comment=f"Handle inserts and deletes to table {table_sql} for destinations {ids}",
+            function=change_1_function,
+        )
+
+        change_2_function = structure.change_2_function(table_id)
+        yield from create_change_function(
+            body=shared_body(
+                lambda change: change.change_2_root,
+                lambda change: change.change_2_body,
+            ),
+            comment=f"Handle updates to table {table_sql} for destinations {ids}",
+            function=change_2_function,
+        )
+
+        yield from create_change_triggers(
+            change_1_function=change_1_function,
+            change_2_function=change_2_function,
+            delete_trigger=structure.delete_trigger(table_id),
+            insert_trigger=structure.insert_trigger(table_id),
+            table=table,
+            update_trigger=structure.update_trigger(table_id),
+        )
+
+        for change in table_changes:
+            if change.update_columns is not None:
+                # sorts before the update trigger
+                yield from create_update_columns(
+                    change,
+                    trigger=structure.update_columns_trigger(
+                        f"{table_id}__{change.id}__{change.table_id}"
+                    ),
+                )
+
+            if change.row is not None:
+                yield from create_row_change(change)
+
+
+def _projection(change: TableChange) -> str:
+    return table_query(change.table, change.table.sql, change.table_id)
@@ -6,7 +6,13 @@ from .format import format
 from .formats.join import JoinRefresh, JoinTargetTable
 from .join_common import JoinTarget, Key
 from .sql import SqlQuery
-from .sql_query import sync_query, upsert_query
+from .sql_query import (
+    insert_query,
+    merge_query,
+    sync_query,
+    upsert_query,
+    use_merge,
+)
 
 
 class JoinTableTarget(JoinTarget):
@@ -14,7 +20,13 @@ class JoinTableTarget(JoinTarget):
     Insert into to a table
     """
 
-    def __init__(self, table: JoinTargetTable, query: str):
+    def __init__(
+        self,
+        table: JoinTargetTable,
+        query: str,
+        postgres_version: typing.Optional[int] = None,
+    ):
+        self._postgres_version = postgres_version
         self._table = table
         self._query = query
 
@@ -27,15 +39,48 @@ FROM {self._table.sql}
             names = self._table.table_key
             return Key(definition=definition, names=names)
 
-    def sql(self, key_table: SqlObject, table_id: typing.Optional[str]) -> SqlQuery:
+    def sql(
+        self,
+        key_table: SqlObject,
+        table_id: typing.Optional[str],
+        in_cte: bool = False,
+    ) -> SqlQuery:
         formatted = format(
             self._query, {"key": str(key_table), "table": table_id or ""}
         )
 
-        return sync_query(
-            columns=self._table.table_columns or self._table.table_key,
-            key=self._table.table_key,
-            key_table=key_table,
-            query=formatted,
-            target=self._table.sql,
-        )
+        columns = self._table.table_columns or self._table.table_key
+
+        if self._table.refresh == JoinRefresh.FULL:
+            if use_merge(self._postgres_version, in_cte):
+                return merge_query(
+                    columns=columns,
+                    key=self._table.table_key,
+                    key_table=key_table,
+                    query=formatted,
+                    skip_unchanged=self._table.skip_unchanged,
+                    target=self._table.sql,
+                )
+            return sync_query(
+                columns=columns,
+                key=self._table.table_key,
+                key_table=key_table,
+                query=formatted,
+                skip_unchanged=self._table.skip_unchanged,
+                target=self._table.sql,
+            )
+        elif self._table.refresh == JoinRefresh.INSERT:
+            return insert_query(
+                columns=columns,
+                key=self._table.table_key,
+                query=formatted,
+                target=self._table.sql,
+            )
+        elif self._table.refresh == JoinRefresh.UPSERT:
+            return upsert_query(
+                columns=columns,
+                key=self._table.table_key,
+                query=formatted,
+                skip_unchanged=self._table.skip_unchanged,
+                target=self._table.sql,
+            )
@@ -50,3 +50,13 @@ def update_excluded(columns: typing.Iterable[SqlId]):
 
 def table_fields(id: SqlId, columns: typing.List[SqlId]):
     return sql_list(str(SqlObject(id, column)) for column in columns)
+
+
+def create_index(
+    table: SqlObject, table_name: str, columns: typing.List[str], unique=False
+):
+    # use PostgreSQL's default name, to match existing indexes
+    name = SqlId("_".join([table_name] + list(columns) + ["idx"]))
+    return f"""
+CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON {table} ({sql_list(SqlId(column) for column in columns)})
+    """.strip()
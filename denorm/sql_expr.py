@@ -0,0 +1,207 @@
+import re
+import typing
+
+from pg_sql import RESERVED_WORDS
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+    |(?P<string>[Ee]'(?:''|\\.|[^'\\])*'|[BbXxNn]?'(?:''|[^'])*')
+    |(?P<dollar>\$(?P<tag>[A-Za-z_][A-Za-z0-9_]*|)\$.*?\$(?P=tag)\$)
+    |(?P<quoted>"(?:""|[^"])*")
+    |(?P<ident>[A-Za-z_\u0080-\uffff][A-Za-z0-9_$\u0080-\uffff]*)
+    |(?P<number>(?:\d+\.?\d*|\.\d+)(?:[Ee][+-]?\d+)?|\$\d+)
+    |(?P<cast>::)
+    |(?P<other>.)
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+
+# keywords that may appear in expressions, in addition to reserved words
+_KEYWORDS = set(RESERVED_WORDS) | {
+    "AT",
+    "BETWEEN",
+    "EXISTS",
+    "FILTER",
+    "FIRST",
+    "FOLLOWING",
+    "LAST",
+    "NULLS",
+    "OVER",
+    "PARTITION",
+    "PRECEDING",
+    "RANGE",
+    "ROW",
+    "ROWS",
+    "UNBOUNDED",
+    "WITHIN",
+    "WITHOUT",
+    "ZONE",
+}
+
+# keywords that introduce subqueries, which are not analyzed
+_QUERY_KEYWORDS = {"SELECT", "TABLE", "VALUES"}
+
+# unreserved keywords that cannot be told apart from columns without parsing
+_UNKNOWN_KEYWORDS = {
+    "ESCAPE",
+    "JSON",
+    "NFC",
+    "NFD",
+    "NFKC",
+    "NFKD",
+    "NORMALIZED",
+    "OPERATOR",
+    "UNKNOWN",
+}
+
+# unreserved keywords that follow another keyword, e.g. AT TIME ZONE
+_FOLLOWING_KEYWORDS = {
+    "AT": {"LOCAL", "TIME"},
+    "GROUP": {"BY"},
+    "ORDER": {"BY"},
+    "PARTITION": {"BY"},
+}
+
+
+class _Token(typing.NamedTuple):
+    kind: str
+    value: str
+
+
+def _tokens(expr: str) -> typing.List[_Token]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(expr):
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        tokens.append(_Token(kind, match.group(kind)))
+    return tokens
+
+
+def _name(token: _Token) -> str:
+    if token.kind == "quoted":
+        return token.value[1:-1].replace('""', '"')
+    return token.value.lower()
+
+
+def expression_columns(
+    expr: str,
+    alias: typing.Optional[str] = None,
+    variables: typing.Iterable[str] = (),
+    other_aliases: typing.Iterable[str] = (),
+) -> typing.Optional[typing.List[str]]:
+    """
+    Find the columns referenced by a SQL expression, in order of appearance.
+
+    Unqualified identifiers and identifiers qualified by alias are columns.
+    Identifiers qualified by other_aliases are ignored.
+    Returns None if the expression cannot be analyzed, e.g. it references the
+    whole row or an unknown table, contains a subquery, or uses a keyword that
+    may be mistaken for a column.
+    """
+    tokens = _tokens(expr)
+    variables = set(variables)
+    other_aliases = set(other_aliases)
+    columns = []
+
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+
+        if token.kind == "ident" and token.value.upper() in _QUERY_KEYWORDS:
+            return None
+
+        if token.kind not in ("ident", "quoted"):
+            i += 1
+            continue
+
+        if token.kind == "ident" and token.value.upper() in _KEYWORDS:
+            i += 1
+            continue
+
+        if token.kind == "ident" and token.value.upper() in _UNKNOWN_KEYWORDS:
+            return None
+
+        if (
+            token.kind == "ident"
+            and 0 < i
+            and tokens[i - 1].kind == "ident"
+            and token.value.upper()
+            in _FOLLOWING_KEYWORDS.get(tokens[i - 1].value.upper(), ())
+        ):
+            i += 1
+            continue
+
+        # dotted name
+        start = i
+        names = [_name(token)]
+        star = False
+        i += 1
+        while i + 1 < len(tokens) and tokens[i].value == ".":
+            if tokens[i + 1].kind in ("ident", "quoted"):
+                names.append(_name(tokens[i + 1]))
+            elif tokens[i + 1].value == "*":
+                star = True
+            else:
+                break
+            i += 2
+            if star:
+                break
+
+        previous = tokens[start - 1] if 0 < start else None
+        following = tokens[i] if i < len(tokens) else None
+
+        if following is not None and following.value == "(":
+            # function
+            continue
+        if following is not None and following.kind in ("string", "dollar"):
+            # typed literal
+            continue
+        if previous is not None and (
+            previous.kind == "cast"
+            or previous.kind == "ident"
+            and previous.value.upper() == "AS"
+        ):
+            # type
+            while i < len(tokens) and tokens[i].kind == "ident":
+                i += 1
+            continue
+        if (
+            previous is not None
+            and previous.kind == "ident"
+            and previous.value.upper() == "COLLATE"
+        ):
+            # collation
+            continue
+        if (
+            previous is not None
+            and previous.value == "("
+            and 1 < start
+            and tokens[start - 2].value.lower() == "extract"
+        ):
+            # extract field
+            continue
+
+        if star:
+            if names == [alias]:
+                return None
+            continue
+
+        if len(names) == 1:
+            if names[0] == alias:
+                return None
+            if names[0] in variables:
+                continue
+            column = names[0]
+        elif len(names) == 2 and names[0] == alias:
+            column = names[1]
+        elif len(names) == 2 and names[0] in other_aliases:
+            continue
+        else:
+            # qualified by an unknown table
+            return None
+        if column not in columns:
+            columns.append(column)
+
+    return columns
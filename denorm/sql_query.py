@@ -12,6 +12,7 @@ def sync_query(
     key_table: SqlObject,
     query: str,
     target: SqlObject,
+    skip_unchanged: bool = False,
 ) -> SqlQuery:
     """
     Insert, update, and delete
@@ -19,15 +20,25 @@ def sync_query(
     data_columns = [SqlId(column) for column in columns if column not in key]
     is_temp = target.names[0].name == "pg_temp"
 
+    expressions = []
+    if skip_unchanged or not data_columns:
+        # unchanged rows are not returned by the upsert, so deletes are found
+        # from the query results instead
+        expressions.append(SqlTableExpr(SqlId("_data"), query))
+        query = "TABLE _data"
+        result = SqlId("_data")
+    else:
+        result = SqlId("_upsert")
+
     if not is_temp:
         query += f"\nORDER BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(key))}"
 
     if data_columns:
         upsert_query = f"""
-INSERT INTO {target} ({sql_list(columns)})
+INSERT INTO {target} AS existing ({sql_list(columns)})
 {query}
 ON CONFLICT ({sql_list(key)}) DO UPDATE
-    SET {update_excluded(data_columns)}
+    {_update_set(data_columns, skip_unchanged)}
 RETURNING {sql_list(key)}
         """.strip()
     elif not is_temp:
@@ -45,18 +56,172 @@ INSERT INTO {target} ({sql_list(columns)})
 {query}
 ON CONFLICT ({sql_list(key)}) DO NOTHING
 """
-    upsert_expression = SqlTableExpr(SqlId("_upsert"), upsert_query)
+    expressions.append(SqlTableExpr(SqlId("_upsert"), upsert_query))
 
     delete_query = f"""
 DELETE FROM {target} AS t
 USING {key_table} AS k
-  LEFT JOIN _upsert AS u ON ({table_fields(SqlId('k'), key)}) = ({table_fields(SqlId('u'), key)})
+  LEFT JOIN {result} AS u ON ({table_fields(SqlId('k'), key)}) = ({table_fields(SqlId('u'), key)})
 WHERE
   ({table_fields(SqlId('t'), key)}) = ({table_fields(SqlId('k'), key)})
   AND u.* IS NOT DISTINCT FROM NULL
     """.strip()
 
-    return SqlQuery(delete_query, expressions=[upsert_expression])
+    return SqlQuery(delete_query, expressions=expressions)
+
+
+def use_merge(postgres_version: typing.Optional[int], in_cte: bool) -> bool:
+    """
+    Whether MERGE is supported (as a data-modifying CTE since 17)
+    """
+    if postgres_version is None:
+        return False
+    return (17 if in_cte else 15) <= postgres_version
+
+
+def merge_query(
+    columns: typing.List[SqlId],
+    key: typing.List[SqlId],
+    key_table: SqlObject,
+    query: str,
+    target: SqlObject,
+    skip_unchanged: bool = False,
+) -> SqlQuery:
+    """
+    Insert, update, and delete, with a MERGE for existing rows
+
+    MERGE raises a unique violation if another transaction concurrently
+    inserts the same key, so new rows are inserted with ON CONFLICT instead.
+    """
+    columns = [SqlId(column) for column in columns]
+    key = [SqlId(column) for column in key]
+    data_columns = [column for column in columns if column not in key]
+
+    k = SqlId("k")
+    d = SqlId("d")
+    s = SqlId("s")
+    t = SqlId("t")
+
+    data_query = f"""
+SELECT
+  {sql_list(f"coalesce({SqlObject(d, column)}, {SqlObject(k, column)}) AS {column}" for column in key)},
+  {sql_list([str(SqlObject(d, column)) for column in data_columns] + [f"{SqlObject(d, key[0])} IS NULL AS _delete"])}
+FROM
+  {key_table} AS k
+  FULL JOIN (
+{indent(query, 2)}
+  ) AS d ({sql_list(columns)}) ON ({table_fields(k, key)}) = ({table_fields(d, key)})
+    """.strip()
+
+    # rows that already exist are left to the MERGE, so that no row is
+    # modified twice
+    insert_query = f"""
+SELECT {table_fields(s, columns)}
+FROM _data AS s
+WHERE
+  NOT s._delete
+  AND NOT EXISTS (SELECT FROM {target} AS t WHERE ({table_fields(t, key)}) = ({table_fields(s, key)}))
+    """.strip()
+    upsert = upsert_query(
+        columns=[column.name for column in columns],
+        key=[column.name for column in key],
+        query=insert_query,
+        skip_unchanged=skip_unchanged,
+        target=target,
+    )
+
+    clauses = [f"""
+WHEN MATCHED AND s._delete THEN
+  DELETE
+        """.strip()]
+    if data_columns:
+        if skip_unchanged:
+            condition = f" AND ({table_fields(t, data_columns)}) IS DISTINCT FROM ({table_fields(s, data_columns)})"
+        else:
+            condition = ""
+        clauses.append(f"""
+WHEN MATCHED{condition} THEN
+  UPDATE SET {sql_list(f"{column} = {SqlObject(s, column)}" for column in data_columns)}
+            """.strip())
+    clauses_sql = "\n".join(clauses)
+
+    merge_query = f"""
+MERGE INTO {target} AS t
+USING _data AS s
+ON ({table_fields(t, key)}) = ({table_fields(s, key)})
+{clauses_sql}
+    """.strip()
+
+    return SqlQuery(
+        merge_query,
+        expressions=[
+            SqlTableExpr(SqlId("_data"), data_query),
+            SqlTableExpr(SqlId("_upsert"), str(upsert)),
+        ],
+    )
+
+
+def merge_insert_query(
+    columns: typing.List[SqlId],
+    key: typing.List[SqlId],
+    query: str,
+    target: SqlObject,
+) -> SqlQuery:
+    """
+    Insert new data, in a single MERGE
+    """
+    columns = [SqlId(column) for column in columns]
+    key = [SqlId(column) for column in key]
+    s = SqlId("s")
+    t = SqlId("t")
+
+    merge_query = f"""
+MERGE INTO {target} AS t
+USING (
+  SELECT DISTINCT *
+  FROM (
+{indent(query, 2)}
+  ) AS q
+) AS s ({sql_list(columns)})
+ON ({table_fields(t, key)}) = ({table_fields(s, key)})
+WHEN NOT MATCHED THEN
+  INSERT ({sql_list(columns)}) VALUES ({table_fields(s, columns)})
+    """.strip()
+
+    return SqlQuery(merge_query)
+
+
+def _update_set(data_columns: typing.List[SqlId], skip_unchanged: bool) -> str:
+    update_set = f"SET {update_excluded(data_columns)}"
+    if skip_unchanged:
+        existing = table_fields(SqlId("existing"), data_columns)
+        excluded = table_fields(SqlId("excluded"), data_columns)
+        update_set += f"\n    WHERE ({existing}) IS DISTINCT FROM ({excluded})"
+    return update_set
+
+
+def insert_query(
+    columns: typing.List[SqlId],
+    key: typing.Optional[typing.List[SqlId]],
+    query: str,
+    target: SqlObject,
+) -> SqlQuery:
+    """
+    Insert new data
+    """
+    if key:
+        query += f"\nORDER BY {sql_list(SqlNumber(i + 1) for i, _ in enumerate(key))}"
+        conflict = f"ON CONFLICT ({sql_list(key)}) DO NOTHING"
+    else:
+        conflict = ""
+
+    insert_query = f"""
+INSERT INTO {target} ({sql_list(columns)})
+{query}
+{conflict}
+    """.strip()
+
+    return SqlQuery(insert_query)
 
 
 def upsert_query(
@@ -64,6 +229,7 @@ def upsert_query(
     key: typing.List[SqlId],
     query: str,
     target: SqlObject,
+    skip_unchanged: bool = False,
 ) -> SqlQuery:
     """
     Upsert data
@@ -76,10 +242,10 @@ def upsert_query(
 
     if data_columns:
         upsert_query = f"""
-INSERT INTO {target} ({sql_list(columns)})
+INSERT INTO {target} AS existing ({sql_list(columns)})
 {query}
 ON CONFLICT ({sql_list(key)}) DO UPDATE
-    SET {update_excluded(data_columns)}
+    {_update_set(data_columns, skip_unchanged)}
         """.strip()
     elif not is_temp:
         upsert_query = f"""
@@ -0,0 +1,206 @@
+"""
+Worker for asynchronous joins.
+
+Threads:
+* listener - LISTEN to queue channels, wake drainers
+* drainer (xN) - Call ID__pcb__TABLE until queues are empty, then wait for a
+  notification or poll with backoff
+"""
+
+import dataclasses
+import logging
+import select
+import threading
+import typing
+
+from pg_sql import SqlId, SqlObject
+
+from .formats.join import JOIN_DATA_JSON_FORMAT, JoinConfig, JoinJoinMode
+from .join_common import Structure
+from .resource import ResourceFactory
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class WorkerQueue(typing.NamedTuple):
+    channel: str
+    batch_function: SqlObject
+
+
+def worker_queues(config: JoinConfig) -> typing.List[WorkerQueue]:
+    """
+    Find the queues of asynchronous joins
+    """
+    structure = Structure(config.schema, config.id)
+
+    return [
+        WorkerQueue(
+            channel=str(structure.queue_table(table_id)),
+            batch_function=structure.queue_batch_function(table_id),
+        )
+        for table_id, table in config.tables.items()
+        if table.join_mode == JoinJoinMode.ASYNC
+    ]
+
+
+@dataclasses.dataclass
+class WorkerIo:
+    configs: typing.List[ResourceFactory[typing.TextIO]]
+    connect: typing.Callable[[], typing.Any]
+
+
+class _Wake:
+    """
+    Wake waiting drainers
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        with self._condition:
+            return self._generation
+
+    def notify(self):
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def wait(self, generation: int, timeout: float) -> bool:
+        """
+        Wait for a notification since the generation. Return whether notified.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._generation != generation, timeout
+            )
+
+
+class Worker:
+    def __init__(
+        self,
+        io: WorkerIo,
+        concurrency: int = 1,
+        max_items: int = 1,
+        max_records: int = 1000,
+        poll_interval: float = 1,
+        poll_max: float = 60,
+    ):
+        self._io = io
+        self._concurrency = concurrency
+        self._max_items = max_items
+        self._max_records = max_records
+        self._poll_interval = poll_interval
+        self._poll_max = poll_max
+        self._stopped = threading.Event()
+        self._wake = _Wake()
+        self._queues = [
+            queue
+            for config in io.configs
+            for queue in worker_queues(JOIN_DATA_JSON_FORMAT.load(config))
+        ]
+
+    def stop(self):
+        """
+        Stop after the current calls finish. Safe to call from a signal handler.
+        """
+        self._stopped.set()
+
+    def run(self):
+        if not self._queues:
+            raise RuntimeError("No asynchronous joins to process")
+
+        drainers = [
+            threading.Thread(target=self._drain_loop, name=f"drainer-{i}")
+            for i in range(self._concurrency)
+        ]
+        for drainer in drainers:
+            drainer.start()
+        try:
+            self._listen_loop()
+        finally:
+            self._stopped.set()
+            self._wake.notify()
+            for drainer in drainers:
+                drainer.join()
+
+    def _listen_loop(self):
+        conn = None
+        while not self._stopped.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    with conn.cursor() as cur:
+                        for queue in self._queues:
+                            cur.execute(f"LISTEN {SqlId(queue.channel)}")
+                    # notifications may have been missed
+                    self._wake.notify()
+
+                if select.select([conn], [], [], 1)[0]:
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self._wake.notify()
+            except Exception:
+                _LOGGER.exception("Failed to listen")
+                conn = self._close(conn)
+                self._stopped.wait(self._poll_interval)
+        self._close(conn)
+
+    def _drain_loop(self):
+        conn = None
+        delay = self._poll_interval
+        while not self._stopped.is_set():
+            generation = self._wake.generation
+            try:
+                if conn is None:
+                    conn = self._connect()
+                processed = self._drain(conn)
+            except Exception:
+                _LOGGER.exception("Failed to process queue")
+                conn = self._close(conn)
+                processed = False
+
+            if processed:
+                delay = self._poll_interval
+            elif self._wake.wait(generation, delay):
+                delay = self._poll_interval
+            else:
+                delay = min(delay * 2, self._poll_max)
+        self._close(conn)
+
+    def _drain(self, conn) -> bool:
+        """
+        Process queues in turn until they are empty. Return whether any items
+        were processed.
+        """
+        processed = False
+        queues = list(self._queues)
+        while queues and not self._stopped.is_set():
+            for queue in list(queues):
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"SELECT items FROM {queue.batch_function}(%s, %s)",
+                        (self._max_items, self._max_records),
+                    )
+                    (items,) = cur.fetchone()
+                if items:
+                    processed = True
+                else:
+                    queues.remove(queue)
+        return processed
+
+    def _connect(self):
+        conn = self._io.connect()
+        conn.autocommit = True
+        return conn
+
+    def _close(self, conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return None
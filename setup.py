@@ -36,7 +36,8 @@ setuptools.setup(
             "psycopg2-binary",
             "setuptools",
             "twine",
-        ]
+        ],
+        "worker": ["psycopg2"],
     },
     package_data={
         "denorm.formats": ["*.json"],
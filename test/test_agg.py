@@ -5,6 +5,8 @@ from file import temp_file
 from pg import connection, transaction
 from process import run_process
 
+from denorm.flush import flush
+
 _SCHEMA_SQL = """
     CREATE TABLE child (
         id int PRIMARY KEY,
@@ -61,6 +63,23 @@ def test_agg(pg_database):
             result = cur.fetchall()
             assert result == [(1, 2, 2), (2, 1, 1)]
 
+        # emptied groups are deleted, without triggers on the target
+        with transaction(conn) as cur:
+            cur.execute("DELETE FROM child WHERE parent_id = 1")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(2, 1, 1)]
+
+            cur.execute("""
+                    SELECT tgname
+                    FROM pg_trigger
+                    WHERE tgrelid = 'parent_child_stat'::regclass
+                """)
+            result = cur.fetchall()
+            assert result == []
+
 
 def test_agg_defer(pg_database):
     with temp_file("denorm-") as schema_file, connection("") as conn:
@@ -96,3 +115,327 @@ def test_agg_defer(pg_database):
             cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
             result = cur.fetchall()
             assert result == [(1, 2, 2), (2, 1, 1)]
+
+
+def test_agg_defer_unlogged(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["consistency"] = "deferred"
+            schema_json["deferredStorage"] = "unlogged"
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+
+                    UPDATE child
+                    SET parent_id = 2
+                    WHERE id = 2;
+                """)
+            cur.execute("TABLE parent_child_stat")
+            result = cur.fetchall()
+            assert result == []
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT to_regclass('pg_temp.test__tmp')")
+            (temp_table,) = cur.fetchone()
+            assert temp_table is None
+
+            cur.execute("SELECT count(*) FROM test__tmp")
+            (count,) = cur.fetchone()
+            assert count == 0
+
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 1, 1), (2, 2, 2)]
+
+        # emptied groups are deleted
+        with transaction(conn) as cur:
+            cur.execute("DELETE FROM child WHERE parent_id = 1")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(2, 2, 2)]
+
+
+def test_agg_defer_flush(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["consistency"] = "deferred"
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1);
+                """)
+            flush(cur, "test")
+
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 2)]
+
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (3, 1);
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 3, 3)]
+
+
+def test_agg_update_columns(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+
+                    UPDATE parent_child_stat
+                    SET child_count = 100
+                    WHERE parent_id = 1;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("UPDATE child SET id = id + 10")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 100), (2, 1, 1)]
+
+        with transaction(conn) as cur:
+            cur.execute("UPDATE child SET parent_id = 1 WHERE id = 13")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 3, 101)]
+
+
+def test_agg_update_columns_keywords(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute("""
+                    CREATE TABLE event (
+                        id int PRIMARY KEY,
+                        created_at timestamptz NOT NULL,
+                        name text NOT NULL
+                    );
+
+                    CREATE TABLE event_stat (
+                        day date NOT NULL,
+                        name text NOT NULL,
+                        _count bigint NOT NULL,
+                        event_count int NOT NULL,
+                        PRIMARY KEY (day, name)
+                    );
+                """)
+
+        with open(schema_file, "w") as f:
+            json.dump(
+                {
+                    "id": "test",
+                    "source": {"name": "event"},
+                    "target": {"name": "event_stat"},
+                    "groups": {
+                        "day": "date_trunc('day', created_at AT TIME ZONE 'UTC')::date",
+                        "name": 'name COLLATE "C"',
+                    },
+                    "aggregates": {"event_count": {"value": "sum(sign)"}},
+                },
+                f,
+            )
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO event (id, created_at, name)
+                    VALUES (1, '2020-01-01 12:00Z', 'a'), (2, '2020-01-01 13:00Z', 'a');
+
+                    UPDATE event_stat SET event_count = 100;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("UPDATE event SET id = id + 10")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM event_stat ORDER BY day, name")
+            result = [(str(d), n, c, v) for d, n, c, v in cur.fetchall()]
+            assert result == [("2020-01-01", "a", 2, 100)]
+
+        with transaction(conn) as cur:
+            cur.execute(
+                "UPDATE event SET created_at = '2020-01-02 12:00Z' WHERE id = 12"
+            )
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM event_stat ORDER BY day, name")
+            result = [(str(d), n, c, v) for d, n, c, v in cur.fetchall()]
+            assert result == [("2020-01-01", "a", 1, 99), ("2020-01-02", "a", 1, 1)]
+
+
+def test_agg_indexes(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute("""
+                    CREATE TABLE child (
+                        id int PRIMARY KEY,
+                        parent_id int
+                    );
+
+                    CREATE TABLE parent_child_stat (
+                        parent_id int NOT NULL,
+                        _count bigint NOT NULL,
+                        child_count int NOT NULL
+                    );
+                """)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        for args in [["--indexes"], []]:
+            output = run_process(
+                ["denorm", "create-agg", "--schema", schema_file, *args]
+            )
+            with transaction(conn) as cur:
+                cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    SELECT indexdef
+                    FROM pg_indexes
+                    WHERE tablename = 'parent_child_stat'
+                """)
+            result = cur.fetchall()
+            assert result == [
+                (
+                    "CREATE UNIQUE INDEX parent_child_stat_parent_id_idx ON public.parent_child_stat USING btree (parent_id)",
+                )
+            ]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute(
+                "SELECT parent_id, child_count FROM parent_child_stat ORDER BY parent_id"
+            )
+            result = cur.fetchall()
+            assert result == [(1, 2), (2, 1)]
+
+
+def test_agg_bypass(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["bypass"] = True
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    SET LOCAL denorm.test__bypass = on;
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+
+                    UPDATE child SET parent_id = 3 WHERE id = 1;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == []
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT test__catchup()")
+
+        with transaction(conn) as cur:
+            cur.execute("TABLE test__stg")
+            result = cur.fetchall()
+            assert result == []
+
+        with transaction(conn) as cur:
+            cur.execute(
+                "SELECT parent_id, child_count FROM parent_child_stat ORDER BY parent_id"
+            )
+            result = cur.fetchall()
+            assert result == [(1, 1), (2, 1), (3, 1)]
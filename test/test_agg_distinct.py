@@ -0,0 +1,139 @@
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE visit (
+        id int PRIMARY KEY,
+        provider_id int NOT NULL,
+        patient_id int
+    );
+
+    CREATE TABLE provider_stat (
+        provider_id int PRIMARY KEY,
+        _count bigint NOT NULL,
+        patient_count int NOT NULL
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "source": {"name": "visit"},
+    "target": {"name": "provider_stat"},
+    "groups": {"provider_id": "provider_id"},
+    "aggregates": {
+        "patient_count": {"kind": "distinct", "value": "patient_id"},
+    },
+}
+
+
+def test_agg_distinct(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO visit (id, provider_id, patient_id)
+                    VALUES (1, 1, 1), (2, 1, 1), (3, 1, 2), (4, 2, 1), (5, 2, NULL);
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM provider_stat ORDER BY provider_id")
+            result = cur.fetchall()
+            assert result == [(1, 3, 2), (2, 2, 1)]
+
+        # a value that is still referenced is counted
+        with transaction(conn) as cur:
+            cur.execute("DELETE FROM visit WHERE id = 1")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM provider_stat ORDER BY provider_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 2), (2, 2, 1)]
+
+        with transaction(conn) as cur:
+            cur.execute("UPDATE visit SET patient_id = 1 WHERE id = 3")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM provider_stat ORDER BY provider_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 1), (2, 2, 1)]
+
+            cur.execute("SELECT * FROM test__dst__patient_count ORDER BY 1, 2")
+            result = cur.fetchall()
+            assert result == [(1, 1, 2), (2, 1, 1)]
+
+        with transaction(conn) as cur:
+            cur.execute("UPDATE visit SET patient_id = 3 WHERE id = 5")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM provider_stat ORDER BY provider_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 1), (2, 2, 2)]
+
+        with transaction(conn) as cur:
+            cur.execute("DELETE FROM visit WHERE provider_id = 1")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM provider_stat ORDER BY provider_id")
+            result = cur.fetchall()
+            assert result == [(2, 2, 2)]
+
+            cur.execute("SELECT * FROM test__dst__patient_count ORDER BY 1, 2")
+            result = cur.fetchall()
+            assert result == [(2, 1, 1), (2, 3, 1)]
+
+
+def test_agg_distinct_existing(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+            cur.execute("""
+                    INSERT INTO visit (id, provider_id, patient_id)
+                    VALUES (1, 1, 1), (2, 1, 2);
+
+                    INSERT INTO provider_stat (provider_id, _count, patient_count)
+                    VALUES (1, 2, 2);
+                """)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        # reference counts are populated from existing records
+        with transaction(conn) as cur:
+            cur.execute(
+                "INSERT INTO visit (id, provider_id, patient_id) VALUES (3, 1, 2)"
+            )
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM provider_stat ORDER BY provider_id")
+            result = cur.fetchall()
+            assert result == [(1, 3, 2)]
@@ -0,0 +1,122 @@
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int NOT NULL,
+        age int NOT NULL
+    );
+
+    CREATE TABLE parent_child_stat (
+        parent_id int PRIMARY KEY,
+        _count bigint NOT NULL,
+        min_age int,
+        max_age int
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "source": {"name": "child"},
+    "target": {"name": "parent_child_stat"},
+    "groups": {"parent_id": "parent_id"},
+    "aggregates": {
+        "min_age": {"kind": "min", "value": "age"},
+        "max_age": {"kind": "max", "value": "age"},
+    },
+}
+
+
+def test_agg_min_max(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--indexes",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id, age)
+                    VALUES (1, 1, 5), (2, 1, 8), (3, 1, 3), (4, 2, 7);
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 3, 3, 8), (2, 1, 7, 7)]
+
+        # removing other values does not change the extremes
+        with transaction(conn) as cur:
+            cur.execute("DELETE FROM child WHERE id = 1")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 3, 8), (2, 1, 7, 7)]
+
+        # removing an extreme recomputes the group
+        with transaction(conn) as cur:
+            cur.execute("UPDATE child SET age = 6 WHERE id = 3")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 6, 8), (2, 1, 7, 7)]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    DELETE FROM child WHERE id = 2;
+
+                    INSERT INTO child (id, parent_id, age)
+                    VALUES (5, 2, 9);
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 1, 6, 6), (2, 2, 7, 9)]
+
+        # a changed record may replace the removed extreme
+        with transaction(conn) as cur:
+            cur.execute("UPDATE child SET age = 1 WHERE id = 4")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 1, 6, 6), (2, 2, 1, 9)]
+
+        with transaction(conn) as cur:
+            cur.execute("DELETE FROM child WHERE parent_id = 1")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(2, 2, 1, 9)]
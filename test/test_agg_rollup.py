@@ -0,0 +1,172 @@
+import copy
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE visit (
+        id int PRIMARY KEY,
+        clinic_id int NOT NULL,
+        org_id int NOT NULL,
+        day date NOT NULL
+    );
+
+    CREATE TABLE clinic_day_stat (
+        clinic_id int NOT NULL,
+        day date NOT NULL,
+        _count bigint NOT NULL,
+        visit_count int NOT NULL,
+        PRIMARY KEY (clinic_id, day)
+    );
+
+    CREATE TABLE clinic_stat (
+        clinic_id int PRIMARY KEY,
+        _count bigint NOT NULL,
+        visit_count int NOT NULL
+    );
+
+    CREATE TABLE org_month_stat (
+        org_id int NOT NULL,
+        month date NOT NULL,
+        _count bigint NOT NULL,
+        visit_count int NOT NULL,
+        PRIMARY KEY (org_id, month)
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "source": {"name": "visit"},
+    "target": {"name": "clinic_day_stat"},
+    "groups": {"clinic_id": "clinic_id", "day": "day"},
+    "aggregates": {
+        "visit_count": {
+            "value": "sum(sign)",
+        }
+    },
+    "rollups": [
+        {
+            "groups": {"clinic_id": "clinic_id"},
+            "target": {"name": "clinic_stat"},
+        },
+        {
+            "groups": {"org_id": "org_id", "month": "date_trunc('month', day)"},
+            "target": {"name": "org_month_stat"},
+        },
+    ],
+}
+
+
+def _check(cur, clinic_day, clinic, org_month):
+    cur.execute("SELECT * FROM clinic_day_stat ORDER BY clinic_id, day")
+    assert [(c, str(d), n, v) for c, d, n, v in cur.fetchall()] == clinic_day
+
+    cur.execute("SELECT * FROM clinic_stat ORDER BY clinic_id")
+    assert cur.fetchall() == clinic
+
+    cur.execute("SELECT * FROM org_month_stat ORDER BY org_id, month")
+    assert [(o, str(m), n, v) for o, m, n, v in cur.fetchall()] == org_month
+
+
+def test_agg_rollup(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO visit (id, clinic_id, org_id, day)
+                    VALUES
+                        (1, 1, 1, '2020-01-01'),
+                        (2, 1, 1, '2020-01-02'),
+                        (3, 2, 1, '2020-02-01');
+                """)
+
+        with transaction(conn) as cur:
+            _check(
+                cur,
+                clinic_day=[
+                    (1, "2020-01-01", 1, 1),
+                    (1, "2020-01-02", 1, 1),
+                    (2, "2020-02-01", 1, 1),
+                ],
+                clinic=[(1, 2, 2), (2, 1, 1)],
+                org_month=[
+                    (1, "2020-01-01", 2, 2),
+                    (1, "2020-02-01", 1, 1),
+                ],
+            )
+
+        with transaction(conn) as cur:
+            cur.execute(
+                "UPDATE visit SET clinic_id = 1, day = '2020-01-03' WHERE id = 3"
+            )
+
+        with transaction(conn) as cur:
+            _check(
+                cur,
+                clinic_day=[
+                    (1, "2020-01-01", 1, 1),
+                    (1, "2020-01-02", 1, 1),
+                    (1, "2020-01-03", 1, 1),
+                ],
+                clinic=[(1, 3, 3)],
+                org_month=[(1, "2020-01-01", 3, 3)],
+            )
+
+
+def test_agg_rollup_bypass(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["bypass"] = True
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    SET LOCAL denorm.test__bypass = on;
+
+                    INSERT INTO visit (id, clinic_id, org_id, day)
+                    VALUES (1, 1, 1, '2020-01-01'), (2, 2, 1, '2020-01-02');
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT test__catchup()")
+
+        with transaction(conn) as cur:
+            _check(
+                cur,
+                clinic_day=[(1, "2020-01-01", 1, 1), (2, "2020-01-02", 1, 1)],
+                clinic=[(1, 1, 1), (2, 1, 1)],
+                org_month=[(1, "2020-01-01", 2, 2)],
+            )
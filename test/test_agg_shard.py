@@ -1,6 +1,10 @@
 import copy
 import json
+import signal
+import subprocess
+import time
 
+import pytest
 from file import temp_file
 from pg import connection, transaction
 from process import run_process
@@ -66,3 +70,204 @@ def test_agg(pg_database):
 
         with transaction(conn) as cur:
             cur.execute("SELECT test__compress()")
+
+
+@pytest.mark.parametrize("storage", ["temp", "unlogged"])
+def test_agg_deferred(pg_database, storage):
+    schema_json = copy.deepcopy(_SCHEMA_JSON)
+    schema_json["consistency"] = "deferred"
+    schema_json["deferredStorage"] = storage
+
+    with temp_file("denorm-") as schema_file, connection("") as conn, connection(
+        ""
+    ) as conn2:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+                """)
+            cur.execute("INSERT INTO child (id, parent_id) VALUES (4, 1)")
+            cur.execute("SELECT * FROM parent_child_stat")
+            assert cur.fetchall() == []
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 3, 3), (2, 1, 1)]
+
+        # a locked shard is skipped
+        with transaction(conn2) as cur2:
+            cur2.execute("SELECT FROM parent_child_stat FOR UPDATE")
+            with transaction(conn) as cur:
+                cur.execute("DELETE FROM child WHERE id = 4")
+
+        with transaction(conn) as cur:
+            cur.execute(
+                "SELECT * FROM parent_child_stat ORDER BY parent_id, child_count"
+            )
+            result = cur.fetchall()
+            assert result == [(1, -1, -1), (1, 3, 3), (2, 1, 1)]
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT test__compress()")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+            result = cur.fetchall()
+            assert result == [(1, 2, 2), (2, 1, 1)]
+
+
+def test_agg_compact(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn, connection(
+        ""
+    ) as conn2:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 2), (3, 3);
+                """)
+
+        # locked shards cause new shards
+        with transaction(conn2) as cur2:
+            cur2.execute("SELECT FROM parent_child_stat FOR UPDATE")
+            with transaction(conn) as cur:
+                cur.execute("""
+                        INSERT INTO child (id, parent_id)
+                        VALUES (4, 1), (5, 2), (6, 3);
+                    """)
+        with transaction(conn) as cur:
+            cur.execute("DELETE FROM child WHERE id = 3")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT merged FROM test__compact(1)")
+            assert cur.fetchone() == (1,)
+
+        with transaction(conn) as cur:
+            cur.execute(
+                "SELECT * FROM parent_child_stat ORDER BY parent_id, child_count"
+            )
+            result = cur.fetchall()
+            assert result == [(1, 2, 2), (2, 1, 1), (2, 1, 1), (3, 0, 0), (3, 1, 1)]
+
+        # locked groups are skipped
+        with transaction(conn2) as cur2:
+            cur2.execute("SELECT FROM parent_child_stat WHERE parent_id = 2 FOR UPDATE")
+            with transaction(conn) as cur:
+                cur.execute("SELECT merged FROM test__compact(NULL)")
+                assert cur.fetchone() == (1,)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT merged FROM test__compact(NULL)")
+            assert cur.fetchone() == (1,)
+
+        with transaction(conn) as cur:
+            cur.execute(
+                "SELECT * FROM parent_child_stat ORDER BY parent_id, child_count"
+            )
+            result = cur.fetchall()
+            assert result == [(1, 2, 2), (2, 2, 2), (3, 1, 1)]
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT merged FROM test__compact(NULL, interval '1 minute')")
+            assert cur.fetchone() == (0,)
+
+
+def test_agg_compactor(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn, connection(
+        ""
+    ) as conn2:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-agg",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 2);
+                """)
+
+        # locked shards cause new shards
+        for id in range(3, 6):
+            with transaction(conn2) as cur2:
+                cur2.execute("SELECT FROM parent_child_stat FOR UPDATE")
+                with transaction(conn) as cur:
+                    cur.execute(
+                        "INSERT INTO child (id, parent_id) VALUES (%s, 1)", (id,)
+                    )
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM test__shard_stats()")
+            assert cur.fetchone() == (2, 5, 4)
+
+        process = subprocess.Popen(
+            [
+                "denorm",
+                "agg-compact",
+                "--schema",
+                schema_file,
+                "--max-groups",
+                "1",
+                "--poll-interval",
+                "0.1",
+            ]
+        )
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for _ in range(100):
+                    cur.execute("SELECT * FROM parent_child_stat ORDER BY parent_id")
+                    result = cur.fetchall()
+                    if result == [(1, 4, 4), (2, 1, 1)]:
+                        break
+                    time.sleep(0.1)
+                assert result == [(1, 4, 4), (2, 1, 1)]
+        finally:
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(10) == 0
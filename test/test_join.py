@@ -1,10 +1,13 @@
 import copy
 import json
 
+import pytest
 from file import temp_file
 from pg import connection, transaction
 from process import run_process
 
+from denorm.flush import flush
+
 _SCHEMA_SQL = """
     CREATE TABLE parent (
         id int PRIMARY KEY,
@@ -128,3 +131,151 @@ def test_join_deferred(pg_database):
             cur.execute("SELECT * FROM child_full ORDER BY id")
             result = cur.fetchall()
             assert result == [(1, "A"), (2, "A"), (3, "B")]
+
+
+def test_join_deferred_unlogged(pg_database):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["consistency"] = "deferred"
+            schema_json["deferredStorage"] = "unlogged"
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn:
+            with transaction(conn) as cur:
+                cur.execute("""
+                        INSERT INTO parent (id, name)
+                        VALUES (1, 'A'), (2, 'B');
+
+                        INSERT INTO child (id, parent_id)
+                        VALUES (1, 1), (2, 1), (3, 2);
+                    """)
+                cur.execute("TABLE child_full")
+                result = cur.fetchall()
+                assert result == []
+
+            with transaction(conn) as cur:
+                cur.execute("SELECT to_regclass('pg_temp.test__key')")
+                (temp_table,) = cur.fetchone()
+                assert temp_table is None
+
+                cur.execute("SELECT count(*) FROM test__key")
+                (count,) = cur.fetchone()
+                assert count == 0
+
+                cur.execute("SELECT count(*) FROM test__pending")
+                (count,) = cur.fetchone()
+                assert count == 0
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "A"), (2, "A"), (3, "B")]
+
+
+@pytest.mark.parametrize("storage", ["temp", "unlogged"])
+def test_join_deferred_chunk(pg_database, storage):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["consistency"] = "deferred"
+            schema_json["deferredChunkSize"] = 2
+            schema_json["deferredStorage"] = storage
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    SELECT i, 1 + i % 2
+                    FROM generate_series(1, 5) AS i;
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "B"), (2, "A"), (3, "B"), (4, "A"), (5, "B")]
+
+
+@pytest.mark.parametrize("storage", ["temp", "unlogged"])
+def test_join_deferred_flush(pg_database, storage):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["consistency"] = "deferred"
+            schema_json["deferredStorage"] = storage
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            # nothing to flush
+            flush(cur, "test")
+
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1);
+                """)
+            flush(cur, "test")
+
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "A"), (2, "A")]
+
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (3, 2);
+                """)
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "A"), (2, "A")]
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "A"), (2, "A"), (3, "B")]
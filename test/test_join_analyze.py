@@ -0,0 +1,100 @@
+import json
+
+import pytest
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int REFERENCES parent (id)
+    );
+
+    CREATE TABLE child_full (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+"""
+
+_SCHEMA_JSON = {
+    "analyzeThreshold": 2,
+    "id": "test",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "joinTargetTable": "child",
+            "joinOn": "parent.id = child.parent_id",
+        },
+    },
+    "destinationTable": {
+        "tableName": "child_full",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            JOIN parent p ON c.parent_id = p.id
+    """,
+}
+
+
+@pytest.mark.parametrize("consistency", ["deferred", "immediate"])
+def test_join_analyze(pg_database, consistency):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump({**_SCHEMA_JSON, "consistency": consistency}, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1);
+                """)
+            cur.execute("SELECT to_regclass('pg_temp.test__chg__child')")
+            (change_table,) = cur.fetchone()
+            assert change_table is None
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (2, 1), (3, 2);
+
+                    UPDATE parent
+                    SET name = name || '2';
+                """)
+            cur.execute("SELECT to_regclass('pg_temp.test__chg__child')")
+            (change_table,) = cur.fetchone()
+            assert change_table is not None
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "A2"), (2, "A2"), (3, "B2")]
@@ -142,3 +142,117 @@ def test_join_async(pg_database):
             cur.execute("SELECT * FROM child_full ORDER BY id")
             result = cur.fetchall()
             assert result == [(1, "_", "A"), (2, "_", "A"), (3, "_", "C")]
+
+
+def test_join_async_batch(pg_database):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO grandparent (id, name)
+                    VALUES (9, '_');
+
+                    INSERT INTO parent (id, grandparent_id, name)
+                    VALUES (1, 9, 'A'), (2, 9, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("UPDATE parent SET name = upper(name || name)")
+
+        results = []
+        with connection("") as conn:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                while True:
+                    cur.execute("SELECT * FROM test__pcb__parent(10, 1)")
+                    result = cur.fetchone()
+                    results.append(result)
+                    if not result[0]:
+                        break
+        assert results == [(2, 2), (2, 1), (1, 0), (0, 0)]
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "_", "AA"), (2, "_", "AA"), (3, "_", "BB")]
+
+
+def test_join_async_continue(pg_database):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO grandparent (id, name)
+                    VALUES (9, '_');
+
+                    INSERT INTO parent (id, grandparent_id, name)
+                    VALUES (1, 9, 'A');
+
+                    INSERT INTO child (id, parent_id)
+                    SELECT i, 1 FROM generate_series(1, 5) AS i;
+
+                    DELETE FROM test__que__parent;
+                """)
+
+        with connection("") as conn:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("UPDATE parent SET name = 'B'")
+                cur.execute("SELECT test__pcs__parent(2)")
+
+                cur.execute("UPDATE parent SET name = 'C'")
+                cur.execute(
+                    "SELECT local_id, foreign_id, end_id, wrap_id FROM test__que__parent"
+                )
+                result = cur.fetchall()
+                assert result == [(1, 2, None, 2)]
+
+                calls = 0
+                while True:
+                    cur.execute("SELECT test__pcs__parent(2)")
+                    (result,) = cur.fetchone()
+                    if not result:
+                        break
+                    calls += 1
+                # 3-4, 5, end, 1-2, end
+                assert calls == 5
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT id, parent_name FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "C"), (2, "C"), (3, "C"), (4, "C"), (5, "C")]
@@ -102,3 +102,65 @@ def test_join_key(pg_database):
             cur.execute("SELECT * FROM child_full ORDER BY id")
             result = cur.fetchall()
             assert result == [(1, "A", ""), (2, "A", ""), (3, "B", "")]
+
+
+def test_join_update_columns(pg_database):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    SELECT a.attname
+                    FROM
+                        pg_trigger AS t
+                        JOIN pg_attribute AS a ON
+                            t.tgrelid = a.attrelid
+                            AND a.attnum = ANY (t.tgattr)
+                    WHERE t.tgname = 'test__upc__parent'
+                    ORDER BY 1
+                """)
+            result = cur.fetchall()
+            assert result == [("id",), ("name",)]
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name, other)
+                    VALUES (1, 'A', '');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1);
+
+                    UPDATE child_full
+                    SET parent_name = 'X';
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("UPDATE parent SET other = 'other'")
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "X", "")]
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("UPDATE parent SET name = 'B', other = 'other2'")
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "B", "other2")]
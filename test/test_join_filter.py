@@ -0,0 +1,120 @@
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL,
+        active bool NOT NULL
+    );
+
+    CREATE TABLE event (
+        id int PRIMARY KEY,
+        kind text NOT NULL,
+        parent_id int REFERENCES parent (id)
+    );
+
+    CREATE TABLE invoice (
+        id int PRIMARY KEY,
+        parent_name text
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "event": {
+            "tableName": "event",
+            "tableColumns": [{"name": "id"}, {"name": "parent_id"}],
+            "tableFilter": "event.kind = 'invoice'",
+            "destinationKeyExpr": ["event.id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "tableFilter": "active",
+            "joinTargetTable": "event",
+            "joinOn": "parent.id = event.parent_id",
+        },
+    },
+    "destinationTable": {
+        "tableName": "invoice",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+    "destinationQuery": """
+        SELECT e.id, p.name
+        FROM ${key} AS d
+            JOIN event e ON d.id = e.id
+            LEFT JOIN parent p ON e.parent_id = p.id AND p.active
+        WHERE e.kind = 'invoice'
+    """,
+}
+
+
+def test_join_filter(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name, active)
+                    VALUES (1, 'A', true), (2, 'B', false);
+
+                    INSERT INTO event (id, kind, parent_id)
+                    VALUES (1, 'invoice', 1), (2, 'view', 1), (3, 'invoice', 2);
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM invoice ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "A"), (3, None)]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    UPDATE event
+                    SET kind = 'invoice'
+                    WHERE id = 2;
+
+                    UPDATE event
+                    SET kind = 'view'
+                    WHERE id = 1;
+
+                    UPDATE parent
+                    SET active = true
+                    WHERE id = 2;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM invoice ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(2, "A"), (3, "B")]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    UPDATE parent
+                    SET active = false
+                    WHERE id = 1;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM invoice ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(2, None), (3, "B")]
@@ -0,0 +1,120 @@
+import copy
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE author (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE genre (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE book (
+        id int PRIMARY KEY,
+        author_id int NOT NULL,
+        genre_id int NOT NULL
+    );
+
+    CREATE INDEX ON book (author_id);
+
+    CREATE TABLE book_full (
+        id int PRIMARY KEY,
+        author_name text,
+        genre_name text
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "author": {
+            "tableName": "author",
+            "joinTargetTable": "book",
+            "joinOn": "author.id = book.author_id",
+        },
+        "book": {
+            "tableName": "book",
+            "destinationKeyExpr": ["book.id"],
+        },
+        "genre": {
+            "tableName": "genre",
+            "tableKey": [{"name": "id"}],
+            "joinTargetTable": "book",
+            "joinTargetKey": ["id"],
+            "joinOn": "genre.id = book.genre_id",
+            "joinMode": "async",
+        },
+    },
+    "destinationTable": {
+        "tableName": "book_full",
+        "tableKey": ["id"],
+    },
+    "destinationQuery": """
+        SELECT b.id, a.name, g.name
+        FROM ${key} AS d
+            JOIN book AS b ON d.id = b.id
+            JOIN author AS a ON b.author_id = a.id
+            JOIN genre AS g ON b.genre_id = g.id
+    """,
+}
+
+
+def test_join_index(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            ["denorm", "create-join", "--indexes", "--schema", schema_file]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    SELECT indexname, indexdef
+                    FROM pg_indexes
+                    WHERE tablename = 'book'
+                    ORDER BY indexname
+                """)
+            result = cur.fetchall()
+            assert result == [
+                (
+                    "book_author_id_idx",
+                    "CREATE INDEX book_author_id_idx ON public.book USING btree (author_id)",
+                ),
+                (
+                    "book_genre_id_id_idx",
+                    "CREATE INDEX book_genre_id_id_idx ON public.book USING btree (genre_id, id)",
+                ),
+                (
+                    "book_pkey",
+                    "CREATE UNIQUE INDEX book_pkey ON public.book USING btree (id)",
+                ),
+            ]
+
+
+def test_join_index_override(pg_database):
+    with temp_file("denorm-") as schema_file:
+        schema_json = copy.deepcopy(_SCHEMA_JSON)
+        schema_json["tables"]["author"]["joinTargetIndex"] = []
+        schema_json["tables"]["genre"]["joinTargetIndex"] = ["genre_id"]
+        with open(schema_file, "w") as f:
+            json.dump(schema_json, f)
+
+        output = run_process(
+            ["denorm", "create-join", "--indexes", "--schema", schema_file]
+        )
+        assert output.decode("utf-8") == (
+            "CREATE INDEX IF NOT EXISTS book_genre_id_id_idx ON book (genre_id, id);\n\n"
+        )
@@ -75,3 +75,11 @@ def test_join_key(pg_database):
             cur.execute("SELECT * FROM child_key ORDER BY id")
             result = cur.fetchall()
             assert result == [(1,), (2,), (3,)]
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("UPDATE parent SET name = 'C' WHERE id = 1")
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_key ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1,), (2,), (3,)]
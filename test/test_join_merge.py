@@ -0,0 +1,213 @@
+import copy
+import json
+import threading
+import time
+
+import pytest
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int REFERENCES parent (id)
+    );
+
+    CREATE TABLE child_full_merge (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+
+    CREATE TABLE child_full_sync (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+"""
+
+_SCHEMA_JSON = {
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "joinTargetTable": "child",
+            "joinOn": "parent.id = child.parent_id",
+        },
+    },
+    "destinationTable": {
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            JOIN parent p ON c.parent_id = p.id
+    """,
+}
+
+
+@pytest.mark.parametrize("consistency", ["deferred", "immediate"])
+def test_join_merge(pg_database, consistency):
+    with connection("") as conn, transaction(conn) as cur:
+        cur.execute(_SCHEMA_SQL)
+
+    for id, postgres_version in [("merge", 15), ("sync", None)]:
+        with temp_file("denorm-") as schema_file:
+            with open(schema_file, "w") as f:
+                schema_json = copy.deepcopy(_SCHEMA_JSON)
+                schema_json["consistency"] = consistency
+                schema_json["id"] = id
+                schema_json["destinationTable"]["tableName"] = f"child_full_{id}"
+                schema_json["postgresVersion"] = postgres_version
+                json.dump(schema_json, f)
+
+            output = run_process(
+                [
+                    "denorm",
+                    "create-join",
+                    "--schema",
+                    schema_file,
+                ]
+            )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+    with connection("") as conn, transaction(conn) as cur:
+        cur.execute("""
+                INSERT INTO parent (id, name)
+                VALUES (1, 'A'), (2, 'B');
+
+                INSERT INTO child (id, parent_id)
+                VALUES (1, 1), (2, 1), (3, 2);
+            """)
+
+    with connection("") as conn, transaction(conn) as cur:
+        cur.execute("""
+                UPDATE parent SET name = 'C' WHERE id = 1;
+
+                DELETE FROM child WHERE id = 2;
+
+                UPDATE child SET id = 4 WHERE id = 3;
+            """)
+
+    with connection("") as conn, transaction(conn) as cur:
+        cur.execute("SELECT * FROM child_full_merge ORDER BY id")
+        merge_result = cur.fetchall()
+        cur.execute("SELECT * FROM child_full_sync ORDER BY id")
+        sync_result = cur.fetchall()
+        assert merge_result == sync_result == [(1, "C"), (4, "B")]
+
+
+_CONCURRENT_SCHEMA_SQL = """
+    CREATE TABLE a (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE b (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE ab (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+"""
+
+_CONCURRENT_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "a": {
+            "tableName": "a",
+            "destinationKeyExpr": ["a.id"],
+        },
+        "b": {
+            "tableName": "b",
+            "destinationKeyExpr": ["b.id"],
+        },
+    },
+    "destinationTable": {
+        "tableName": "ab",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "name"],
+    },
+    "destinationQuery": """
+        SELECT d.id, coalesce(a.name, b.name)
+        FROM ${key} AS d
+            LEFT JOIN a ON d.id = a.id
+            LEFT JOIN b ON d.id = b.id
+        WHERE a.id IS NOT NULL OR b.id IS NOT NULL
+    """,
+    "postgresVersion": 15,
+}
+
+
+def test_join_merge_concurrent_insert(pg_database):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_CONCURRENT_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_CONCURRENT_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+    errors = []
+
+    def insert_b():
+        try:
+            with connection("") as conn, transaction(conn) as cur:
+                cur.execute("INSERT INTO b (id, name) VALUES (1, 'A')")
+        except Exception as e:
+            errors.append(e)
+
+    with connection("") as conn_a, connection("") as conn_check:
+        with transaction(conn_a) as cur:
+            cur.execute("INSERT INTO a (id, name) VALUES (1, 'A')")
+
+            # b inserts the same destination key, and waits for a to commit
+            thread = threading.Thread(target=insert_b)
+            thread.start()
+
+            # pg_stat_activity is cached per transaction, so poll outside one
+            conn_check.autocommit = True
+            deadline = time.monotonic() + 10
+            with conn_check.cursor() as check_cur:
+                while True:
+                    check_cur.execute("""
+                            SELECT count(*)
+                            FROM pg_stat_activity
+                            WHERE wait_event_type = 'Lock' AND datname = 'test'
+                        """)
+                    if check_cur.fetchone()[0]:
+                        break
+                    assert time.monotonic() < deadline, "b did not wait for a"
+                    time.sleep(0.05)
+
+        thread.join()
+
+    assert errors == []
+
+    with connection("") as conn, transaction(conn) as cur:
+        cur.execute("SELECT * FROM ab ORDER BY id")
+        result = cur.fetchall()
+        assert result == [(1, "A")]
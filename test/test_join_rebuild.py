@@ -0,0 +1,134 @@
+import copy
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int REFERENCES parent (id)
+    );
+
+    CREATE TABLE child_full (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "joinTargetTable": "child",
+            "joinOn": "parent.id = child.parent_id",
+        },
+    },
+    "destinationTable": {
+        "tableName": "child_full",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            JOIN parent p ON c.parent_id = p.id
+    """,
+}
+
+
+def _run(destination_table, config={}):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["destinationTable"].update(destination_table)
+            schema_json.update(config)
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    SELECT i, i % 2 + 1 FROM generate_series(1, 10) AS i;
+
+                    ANALYZE child_full;
+                """)
+
+        with transaction(conn) as cur:
+            # not refreshed incrementally
+            cur.execute("INSERT INTO child_full (id, parent_name) VALUES (11, '_')")
+
+        with transaction(conn) as cur:
+            cur.execute("UPDATE child SET parent_id = 1 WHERE id = 2")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT count(*) FROM child_full WHERE id = 11")
+            (result,) = cur.fetchone()
+            assert result == 1
+
+        with transaction(conn) as cur:
+            cur.execute("UPDATE parent SET name = 'C' WHERE id = 1")
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            return cur.fetchall()
+
+
+_EXPECTED = [
+    (1, "B"),
+    (2, "C"),
+    (3, "B"),
+    (4, "C"),
+    (5, "B"),
+    (6, "C"),
+    (7, "B"),
+    (8, "C"),
+    (9, "B"),
+    (10, "C"),
+]
+
+
+def test_join_rebuild_keys(pg_database):
+    result = _run({"rebuildKeys": 3})
+    assert result == _EXPECTED
+
+
+def test_join_rebuild_fraction(pg_database):
+    result = _run({"rebuildFraction": 0.3})
+    assert result == _EXPECTED
+
+
+def test_join_rebuild_deferred_chunks(pg_database):
+    # chunks are below the threshold, but the keys are not
+    result = _run(
+        {"rebuildKeys": 3}, {"consistency": "deferred", "deferredChunkSize": 2}
+    )
+    assert result == _EXPECTED
@@ -0,0 +1,162 @@
+import copy
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int REFERENCES parent (id)
+    );
+
+    CREATE TABLE child_full (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "joinTargetTable": "child",
+            "joinOn": "parent.id = child.parent_id",
+        },
+    },
+    "destinationTable": {
+        "tableName": "child_full",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            JOIN parent p ON c.parent_id = p.id
+    """,
+}
+
+
+def _run(refresh):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["destinationTable"]["refresh"] = refresh
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    UPDATE parent SET name = 'C' WHERE id = 1;
+
+                    DELETE FROM child WHERE id = 3;
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            return cur.fetchall()
+
+
+def test_join_refresh_full(pg_database):
+    result = _run("full")
+    assert result == [(1, "C"), (2, "C")]
+
+
+def test_join_refresh_insert(pg_database):
+    result = _run("insert")
+    assert result == [(1, "A"), (2, "A"), (3, "B")]
+
+
+def test_join_refresh_upsert(pg_database):
+    result = _run("upsert")
+    assert result == [(1, "C"), (2, "C"), (3, "B")]
+
+
+def test_join_skip_unchanged(pg_database):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            schema_json["destinationTable"]["skipUnchanged"] = True
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT id, xmin::text FROM child_full ORDER BY id")
+            versions = cur.fetchall()
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (3, 'B');
+
+                    UPDATE child SET parent_id = 3 WHERE id = 3;
+
+                    UPDATE parent SET name = 'C' WHERE id = 1;
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT id, xmin::text FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result[2] == versions[2]
+            assert result[0] != versions[0]
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "C"), (2, "C"), (3, "B")]
@@ -0,0 +1,125 @@
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int REFERENCES parent (id)
+    );
+
+    CREATE TABLE child_full (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+            "rowTrigger": True,
+        },
+        "parent": {
+            "tableName": "parent",
+            "joinTargetTable": "child",
+            "joinOn": "parent.id = child.parent_id",
+            "rowTrigger": True,
+            "tableColumns": [{"name": "id"}, {"name": "name"}],
+        },
+    },
+    "destinationTable": {
+        "tableName": "child_full",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            JOIN parent p ON c.parent_id = p.id
+    """,
+}
+
+
+def test_join_row(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1);
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (2, 1), (3, 2);
+                """)
+            cur.execute(
+                "SELECT current_setting('denorm.test__row__child__insert', true)"
+            )
+            (setting,) = cur.fetchone()
+            assert setting == ""
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "A"), (2, "A"), (3, "B")]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    UPDATE parent
+                    SET name = 'C'
+                    WHERE id = 1;
+
+                    UPDATE child
+                    SET parent_id = 2
+                    WHERE id = 1;
+
+                    DELETE FROM child
+                    WHERE id = 2;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "B"), (3, "B")]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (4, 1)
+                    ON CONFLICT (id) DO UPDATE
+                        SET parent_id = excluded.parent_id;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "C"), (3, "B"), (4, "C")]
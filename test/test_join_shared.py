@@ -0,0 +1,256 @@
+import json
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int REFERENCES parent (id),
+        note text
+    );
+
+    CREATE TABLE child_full (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+
+    CREATE TABLE child_note (
+        id int PRIMARY KEY,
+        note text
+    );
+"""
+
+_FULL_SCHEMA_JSON = {
+    "id": "full",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+            "updateColumns": ["parent_id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "joinTargetTable": "child",
+            "joinOn": "parent.id = child.parent_id",
+        },
+    },
+    "destinationTable": {
+        "tableName": "child_full",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            JOIN parent p ON c.parent_id = p.id
+    """,
+}
+
+_NOTE_SCHEMA_JSON = {
+    "id": "note",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+        },
+    },
+    "destinationTable": {
+        "tableName": "child_note",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "note"],
+    },
+    "destinationQuery": """
+        SELECT c.id, c.note
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+    """,
+}
+
+
+def test_join_shared(pg_database):
+    with temp_file("denorm-") as full_file, temp_file(
+        "denorm-"
+    ) as note_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(full_file, "w") as f:
+            json.dump(_FULL_SCHEMA_JSON, f)
+        with open(note_file, "w") as f:
+            json.dump(_NOTE_SCHEMA_JSON, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                full_file,
+                "--schema",
+                note_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    SELECT tgname
+                    FROM pg_trigger
+                    WHERE tgrelid = 'child'::regclass AND NOT tgisinternal
+                    ORDER BY tgname
+                """)
+            result = cur.fetchall()
+            assert result == [
+                ("denorm__del__child",),
+                ("denorm__ins__child",),
+                ("denorm__upc__child__full__child",),
+                ("denorm__upd__child",),
+            ]
+
+            # both joins watch every column, so changes are projected once
+            cur.execute("SELECT viewname FROM pg_views WHERE viewname LIKE 'denorm%'")
+            result = cur.fetchall()
+            assert result == [("denorm__prj__child__1",)]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id, note)
+                    VALUES (1, 1, 'x'), (2, 1, 'y');
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    UPDATE child
+                    SET note = 'z'
+                    WHERE id = 1;
+
+                    UPDATE child
+                    SET parent_id = 2
+                    WHERE id = 2;
+
+                    DELETE FROM child
+                    WHERE id = 1;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(2, "B")]
+
+            cur.execute("SELECT * FROM child_note ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(2, "y")]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    UPDATE child
+                    SET note = 'w'
+                    WHERE id = 2;
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_note ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(2, "w")]
+
+
+def test_join_shared_schemas(pg_database):
+    with temp_file("denorm-") as a_file, temp_file("denorm-") as b_file, connection(
+        ""
+    ) as conn:
+        with transaction(conn) as cur:
+            cur.execute("""
+                    CREATE SCHEMA a;
+
+                    CREATE SCHEMA b;
+
+                    CREATE TABLE a.item (
+                        id int PRIMARY KEY
+                    );
+
+                    CREATE TABLE b.item (
+                        id int PRIMARY KEY
+                    );
+
+                    CREATE TABLE a_item_full (
+                        id int PRIMARY KEY
+                    );
+
+                    CREATE TABLE b_item_full (
+                        id int PRIMARY KEY
+                    );
+                """)
+
+        for file, schema in [(a_file, "a"), (b_file, "b")]:
+            with open(file, "w") as f:
+                json.dump(
+                    {
+                        "id": schema,
+                        "schema": "a",
+                        "tables": {
+                            "item": {
+                                "tableSchema": schema,
+                                "tableName": "item",
+                                "destinationKeyExpr": ["item.id"],
+                            },
+                        },
+                        "destinationTable": {
+                            "tableName": f"{schema}_item_full",
+                            "tableKey": ["id"],
+                        },
+                    },
+                    f,
+                )
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                a_file,
+                "--schema",
+                b_file,
+            ]
+        )
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    SELECT p.proname
+                    FROM pg_proc AS p
+                    WHERE p.pronamespace = 'a'::regnamespace AND p.proname LIKE 'denorm%'
+                    ORDER BY 1
+                """)
+            result = cur.fetchall()
+            assert result == [
+                ("denorm__chg1__a__item",),
+                ("denorm__chg1__b__item",),
+                ("denorm__chg2__a__item",),
+                ("denorm__chg2__b__item",),
+            ]
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO a.item (id) VALUES (1);
+
+                    INSERT INTO b.item (id) VALUES (2);
+                """)
+
+        with transaction(conn) as cur:
+            cur.execute("SELECT * FROM a_item_full")
+            assert cur.fetchall() == [(1,)]
+
+            cur.execute("SELECT * FROM b_item_full")
+            assert cur.fetchall() == [(2,)]
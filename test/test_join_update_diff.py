@@ -0,0 +1,105 @@
+import copy
+import json
+
+import pytest
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int
+    );
+
+    CREATE TABLE child_full (
+        id int PRIMARY KEY,
+        parent_name text
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "tableKey": [{"name": "id"}],
+            "destinationKeyExpr": ["child.id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "tableKey": [{"name": "id"}],
+            "tableColumns": [{"name": "id"}, {"name": "name"}],
+            "joinTargetTable": "child",
+            "joinOn": "parent.id = child.parent_id",
+        },
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            LEFT JOIN parent p ON c.parent_id = p.id
+    """,
+    "destinationTable": {
+        "tableName": "child_full",
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+    },
+}
+
+
+@pytest.mark.parametrize("update_diff", ["count", "except", "key"])
+def test_join_update_diff(pg_database, update_diff):
+    with temp_file("denorm-") as schema_file:
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            schema_json = copy.deepcopy(_SCHEMA_JSON)
+            for table in schema_json["tables"].values():
+                table["updateDiff"] = update_diff
+            json.dump(schema_json, f)
+
+        output = run_process(
+            [
+                "denorm",
+                "create-join",
+                "--schema",
+                schema_file,
+            ]
+        )
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    VALUES (1, 'A'), (2, 'B');
+
+                    INSERT INTO child (id, parent_id)
+                    VALUES (1, 1), (2, 1), (3, 2);
+                """)
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("UPDATE parent SET name = 'C' WHERE id = 1")
+            cur.execute("UPDATE parent SET name = name")
+            cur.execute("UPDATE child SET parent_id = 1 WHERE id = 3")
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, "C"), (2, "C"), (3, "C")]
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("UPDATE parent SET id = 3 WHERE id = 1")
+            cur.execute("UPDATE child SET id = 4 WHERE id = 3")
+
+        with connection("") as conn, transaction(conn) as cur:
+            cur.execute("SELECT * FROM child_full ORDER BY id")
+            result = cur.fetchall()
+            assert result == [(1, None), (2, None), (4, None)]
@@ -0,0 +1,116 @@
+import json
+import signal
+import subprocess
+import time
+
+from file import temp_file
+from pg import connection, transaction
+from process import run_process
+
+_SCHEMA_SQL = """
+    CREATE TABLE parent (
+        id int PRIMARY KEY,
+        name text NOT NULL
+    );
+
+    CREATE TABLE child (
+        id int PRIMARY KEY,
+        parent_id int NOT NULL REFERENCES parent (id)
+    );
+
+    CREATE TABLE child_full (
+        id int PRIMARY KEY,
+        parent_name text NOT NULL
+    );
+"""
+
+_SCHEMA_JSON = {
+    "id": "test",
+    "tables": {
+        "child": {
+            "tableName": "child",
+            "destinationKeyExpr": ["child.id"],
+        },
+        "parent": {
+            "tableName": "parent",
+            "tableKey": [{"name": "id"}],
+            "joinTargetTable": "child",
+            "joinTargetKey": ["id"],
+            "joinMode": "async",
+            "joinOn": "parent.id = child.parent_id",
+        },
+    },
+    "destinationTable": {
+        "tableKey": ["id"],
+        "tableColumns": ["id", "parent_name"],
+        "tableName": "child_full",
+    },
+    "destinationQuery": """
+        SELECT c.id, p.name
+        FROM ${key} AS d
+            JOIN child c ON d.id = c.id
+            JOIN parent p ON c.parent_id = p.id
+    """,
+}
+
+
+def _wait_for(cur, query, expected):
+    for _ in range(100):
+        cur.execute(query)
+        result = cur.fetchall()
+        if result == expected:
+            return
+        time.sleep(0.1)
+    assert result == expected
+
+
+def test_worker(pg_database):
+    with temp_file("denorm-") as schema_file, connection("") as conn:
+        with transaction(conn) as cur:
+            cur.execute(_SCHEMA_SQL)
+
+        with open(schema_file, "w") as f:
+            json.dump(_SCHEMA_JSON, f)
+
+        output = run_process(["denorm", "create-join", "--schema", schema_file])
+        with transaction(conn) as cur:
+            cur.execute(output.decode("utf-8"))
+
+        with transaction(conn) as cur:
+            cur.execute("""
+                    INSERT INTO parent (id, name)
+                    SELECT i, 'A' FROM generate_series(1, 2) AS i;
+
+                    INSERT INTO child (id, parent_id)
+                    SELECT i, i % 2 + 1 FROM generate_series(1, 50) AS i;
+                """)
+
+        process = subprocess.Popen(
+            [
+                "denorm",
+                "worker",
+                "--schema",
+                schema_file,
+                "--concurrency",
+                "2",
+                "--max-records",
+                "10",
+                "--poll-max",
+                "0.5",
+            ]
+        )
+        try:
+            with transaction(conn) as cur:
+                cur.execute("UPDATE parent SET name = 'B'")
+
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                _wait_for(
+                    cur,
+                    "SELECT parent_name, count(*) FROM child_full GROUP BY 1",
+                    [("B", 50)],
+                )
+                _wait_for(cur, "TABLE test__que__parent", [])
+        finally:
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(10) == 0